@@ -0,0 +1,189 @@
+# Import libraries
+import time
+import heapq
+import threading
+import itertools
+from concurrent.futures import Future
+
+## Motion arbiter ##
+# Every manoeuvre runs as a command in one arbiter thread, so the main loop and the deviation
+# correction thread can no longer drive the motor pins at the same time. Commands wait in a priority
+# queue and callers get a Future for each one. A higher priority command pre-empts a running
+# pre-emptible command (a straight move), which is put back at the front of its priority and resumed
+# afterwards. Commands that are not pre-emptible (turns, collecting) always run to the end.
+CORRECTION = 0  # Deviation corrections
+MANOEUVRE = 1   # Moves and turns of the sweep
+
+class MotionCommand:
+    # run(command) performs the manoeuvre in the arbiter thread and returns the command's result.
+    # A pre-emptible run must return promptly once command.interrupt is set; if command.preempted is
+    # set when it returns, run is called again later to carry on from where it stopped.
+    def __init__(self, name, run, priority=MANOEUVRE, preemptible=False):
+        self.name = name
+        self.run = run
+        self.priority = priority
+        self.preemptible = preemptible
+        self.future = Future()
+        self.interrupt = threading.Event()
+        self.preempted = False
+        self.sequence = None
+        self.submitted_at = None
+        self.started_at = None
+
+class MotionArbiter:
+    def __init__(self):
+        self.queue = []  # Heap of (priority, sequence, command)
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.current = None
+        self.stopping = False
+        self.thread = None
+        self.stats = {
+            'submitted': 0, 'started': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'preemptions': 0,
+            'max_queue_depth': 0, 'total_wait_s': 0.0, 'max_wait_s': 0.0, 'total_latency_s': 0.0,
+            'max_latency_s': 0.0
+        }
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        # Interrupts the running command, which stops its motors, and cancels the queue
+        with self.condition:
+            self.stopping = True
+            if self.current is not None:
+                self.current.interrupt.set()
+            while self.queue:
+                _, _, command = heapq.heappop(self.queue)
+                command.future.cancel()
+                self.stats['cancelled'] += 1
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, command):
+        # Queue a command and return its Future
+        with self.condition:
+            if self.stopping:
+                raise RuntimeError("Motion arbiter is stopped")
+            command.sequence = next(self.sequence)
+            command.submitted_at = time.monotonic()
+            heapq.heappush(self.queue, (command.priority, command.sequence, command))
+            self.stats['submitted'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self.queue))
+
+            current = self.current
+            if (current is not None and current.preemptible and not current.preempted
+                    and command.priority < current.priority):
+                current.preempted = True
+                current.interrupt.set()
+            self.condition.notify()
+        return command.future
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                _, _, command = heapq.heappop(self.queue)
+                if command.started_at is None:
+                    if not command.future.set_running_or_notify_cancel():
+                        self.stats['cancelled'] += 1
+                        continue
+                    command.started_at = time.monotonic()
+                    self.stats['started'] += 1
+                    wait = command.started_at - command.submitted_at
+                    self.stats['total_wait_s'] += wait
+                    self.stats['max_wait_s'] = max(self.stats['max_wait_s'], wait)
+                self.current = command
+
+            try:
+                result = command.run(command)
+            except Exception as e:
+                print(f"Motion command {command.name} failed: {e}")
+                with self.condition:
+                    self.current = None
+                    self.stats['failed'] += 1
+                command.future.set_exception(e)
+                continue
+
+            with self.condition:
+                self.current = None
+                if command.preempted and not self.stopping:
+                    # Back in the queue under its original sequence, ahead of anything newer
+                    command.preempted = False
+                    command.interrupt.clear()
+                    heapq.heappush(self.queue, (command.priority, command.sequence, command))
+                    self.stats['preemptions'] += 1
+                    continue
+                latency = time.monotonic() - command.submitted_at
+                self.stats['completed'] += 1
+                self.stats['total_latency_s'] += latency
+                self.stats['max_latency_s'] = max(self.stats['max_latency_s'], latency)
+            command.future.set_result(result)
+
+    def get_stats(self):
+        # Queue depth and command latency (from submission to completion) in ms
+        with self.condition:
+            stats = dict(self.stats)
+            stats['queue_depth'] = len(self.queue)
+            stats['current'] = self.current.name if self.current is not None else None
+        started = stats['started']
+        return {
+            'submitted': stats['submitted'],
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'cancelled': stats['cancelled'],
+            'preemptions': stats['preemptions'],
+            'current': stats['current'],
+            'queue_depth': stats['queue_depth'],
+            'max_queue_depth': stats['max_queue_depth'],
+            'mean_wait_ms': stats['total_wait_s'] / started * 1000 if started else 0.0,
+            'max_wait_ms': stats['max_wait_s'] * 1000,
+            'mean_latency_ms': stats['total_latency_s'] / stats['completed'] * 1000 if stats['completed'] else 0.0,
+            'max_latency_ms': stats['max_latency_s'] * 1000
+        }
+
+motion_arbiter = None
+motion_arbiter_lock = threading.Lock()
+
+def start_motion_arbiter():
+    global motion_arbiter
+    with motion_arbiter_lock:
+        if motion_arbiter is None:
+            motion_arbiter = MotionArbiter()
+        motion_arbiter.start()
+        return motion_arbiter
+
+def stop_motion_arbiter():
+    global motion_arbiter
+    with motion_arbiter_lock:
+        if motion_arbiter is not None:
+            motion_arbiter.stop()
+            motion_arbiter = None
+
+def is_motion_arbiter_running():
+    arbiter = motion_arbiter
+    return arbiter is not None and arbiter.is_running()
+
+def submit_motion(command):
+    # The arbiter is only started by start_motion_arbiter, never from here, so nothing can drive the
+    # motors again once it has been stopped
+    arbiter = motion_arbiter
+    if arbiter is None:
+        raise RuntimeError("Motion arbiter is not running")
+    return arbiter.submit(command)
+
+def get_motion_stats():
+    arbiter = motion_arbiter
+    return arbiter.get_stats() if arbiter is not None else None
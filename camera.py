@@ -0,0 +1,155 @@
+# Import libraries
+import os
+import re
+import time
+import queue
+import threading
+from PIL import Image
+
+## Camera service ##
+CAMERA_INDEX = 0
+CAMERA_SIZE = (640, 480)
+
+class CameraService:
+    # Opens and configures the Pi camera once and keeps it streaming between ML runs.
+    # frame_source replaces the camera with any callable returning an RGB frame as a
+    # (height, width, 3) uint8 array, so the pipeline can run without a Pi camera.
+    def __init__(self, camera_index=CAMERA_INDEX, size=CAMERA_SIZE, frame_source=None):
+        self.camera_index = camera_index
+        self.size = size
+        self.frame_source = frame_source
+        self.picam2 = None
+        self.lock = threading.Lock()
+        self.opened_at = None
+        self.frame_count = 0
+        self.last_frame_time = None
+        self.last_error = None
+
+    def open(self):
+        with self.lock:
+            if self.is_open():
+                return
+            if self.frame_source is None:
+                # Imported here so a fake frame source works off the Pi
+                from picamera2 import Picamera2
+                picam2 = Picamera2(self.camera_index)
+                # "BGR888" gives arrays in RGB pixel order, which is what the classifiers expect
+                config = picam2.create_preview_configuration(main={"size": self.size, "format": "BGR888"})
+                picam2.configure(config)
+                picam2.start()
+                self.picam2 = picam2
+            self.opened_at = time.monotonic()
+            print("Camera started.")
+
+    def close(self):
+        with self.lock:
+            if self.picam2 is not None:
+                try:
+                    self.picam2.stop()
+                    self.picam2.close()
+                except Exception as e:
+                    print(f"Camera cleanup error: {e}")
+                self.picam2 = None
+            self.opened_at = None
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def focus(self):
+        if self.picam2 is not None:
+            with self.lock:
+                self.picam2.set_controls({"AfMode": 1})
+                self.picam2.autofocus_cycle()
+
+    def capture_array(self):
+        # Latest frame from the running stream
+        self.open()
+        try:
+            with self.lock:
+                if self.frame_source is not None:
+                    frame = self.frame_source()
+                else:
+                    frame = self.picam2.capture_array("main")
+        except Exception as e:
+            self.last_error = e
+            raise
+        self.frame_count += 1
+        self.last_frame_time = time.monotonic()
+        return frame
+
+    def capture_file(self, path):
+        Image.fromarray(self.capture_array()).save(path)
+
+    def health_check(self):
+        # Grabs a frame and reports whether the camera is streaming
+        status = {'open': self.is_open(), 'ok': False, 'frame_shape': None, 'capture_ms': None, 'error': None}
+        try:
+            start = time.perf_counter()
+            frame = self.capture_array()
+            status['capture_ms'] = (time.perf_counter() - start) * 1000
+            status['frame_shape'] = tuple(frame.shape)
+            status['ok'] = frame.ndim == 3 and frame.shape[0] > 0 and frame.shape[1] > 0
+        except Exception as e:
+            status['error'] = str(e)
+        status['open'] = self.is_open()
+        status['frames'] = self.frame_count
+        status['uptime_s'] = time.monotonic() - self.opened_at if self.opened_at is not None else 0.0
+        return status
+
+## Debug image sink ##
+class DebugImageSink:
+    # Writes frames to test<N>.jpg from a background thread so saving never delays the pipeline.
+    # The next free index is found once at start-up instead of probing files on every capture.
+    def __init__(self, directory=".", max_pending=8):
+        self.directory = directory
+        self.frames = queue.Queue(maxsize=max_pending)
+        self.next_index = self._find_next_index()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _find_next_index(self):
+        indices = [int(match.group(1)) for match in map(re.compile(r"test(\d+)\.jpg$").match, os.listdir(self.directory)) if match]
+        return max(indices, default=0) + 1
+
+    def submit(self, frame):
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            print("Debug image sink is full, dropping frame.")
+
+    def _run(self):
+        while True:
+            frame = self.frames.get()
+            image_path = os.path.join(self.directory, f"test{self.next_index}.jpg")
+            self.next_index += 1
+            try:
+                Image.fromarray(frame).save(image_path)
+                print(f"Image saved: {image_path}")
+            except Exception as e:
+                print(f"Failed to save {image_path}: {e}")
+
+debug_sink = None
+
+def save_debug_frame(frame):
+    global debug_sink
+    if debug_sink is None:
+        debug_sink = DebugImageSink()
+    debug_sink.submit(frame)
+
+camera_service = None
+camera_service_lock = threading.Lock()  # start_camera may run in a background thread at startup
+
+def start_camera(frame_source=None):
+    global camera_service
+    with camera_service_lock:
+        if camera_service is None:
+            camera_service = CameraService(frame_source=frame_source)
+        service = camera_service
+    service.open()
+    return service
+
+def stop_camera():
+    global camera_service
+    if camera_service is not None:
+        camera_service.close()
+        camera_service = None
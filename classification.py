@@ -1,14 +1,43 @@
-import os
+import time
+import resource
 import warnings
-import torch
-from torchvision import models, transforms
-from fastai.vision.all import load_learner, PILImage
-from picamera2 import Picamera2
-from PIL import Image
+import threading
+from functools import lru_cache
+import numpy as np
+from camera import start_camera, save_debug_frame, CAMERA_SIZE
+from classification_cache import classification_cache, dhash
+
+# torch, torchvision, fastai and the inference backends take seconds to import on the Pi, so they
+# are imported on first use by import_ml_libraries rather than when this module is imported
+torch = None
+models = None
+load_learner = None
+PILImage = None
+create_backend = None
+ml_import_lock = threading.Lock()
+
+def import_ml_libraries():
+    global torch, models, load_learner, PILImage, create_backend, IMAGENET_MEAN, IMAGENET_STD
+    with ml_import_lock:
+        if create_backend is not None:
+            return
+        import torch as torch_module
+        from torchvision import models as torchvision_models
+        from fastai.vision.all import load_learner as fastai_load_learner, PILImage as fastai_image
+        from inference_backends import create_backend as create_inference_backend
+
+        torch, models, load_learner, PILImage = torch_module, torchvision_models, fastai_load_learner, fastai_image
+        IMAGENET_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+        IMAGENET_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+        create_backend = create_inference_backend
 
 # Load all classes
-with open("model_weight.txt", "r") as file:
-    IMAGENET_CLASSES = {i: line.strip() for i, line in enumerate(file.readlines())}
+IMAGENET_CLASSES_PATH = "model_weight.txt"
+
+@lru_cache(maxsize=1)
+def load_imagenet_classes(path=IMAGENET_CLASSES_PATH):
+    with open(path, "r") as file:
+        return {i: line.strip() for i, line in enumerate(file.readlines())}
 
 # First Layer: Non-garbage object classes
 NON_GARBAGE_CLASSES = [
@@ -22,115 +51,350 @@ NON_GARBAGE_CLASSES = [
 
 # Thresholds
 CONFIDENCE_THRESHOLD = 0.3
-MAX_RETRIES = 5
+BURST_SIZE = 4  # Frames captured and classified together
+MAX_BURSTS = 2
 SECOND_LAYER_THRESHOLD = 0.7
 
+# Save every captured frame to disk in the background for debugging
+SAVE_DEBUG_IMAGES = False
+
+# Model files
+PTH_MODEL_PATH = "first_layer.pth"
+PKL_MODEL_PATH = "garbage_model.pkl"
+# MobileNetV3-Small state dict with the same ImageNet classes. torchvision's pretrained weights work:
+#   torch.save(torchvision.models.mobilenet_v3_small(weights="IMAGENET1K_V1").state_dict(), "gate_model.pth")
+# Without the file the gate is skipped and every burst goes to the first layer.
+GATE_MODEL_PATH = "gate_model.pth"
+
+# Gate cascade: the small gate model sees every burst first and settles the obvious cases.
+# A confident non-garbage vote returns straight away, a confident vote for any other class skips
+# the first layer and goes to the garbage classifier, and only the uncertain band runs the first layer.
+GATE_ENABLED = True
+GATE_NON_GARBAGE_THRESHOLD = 0.6
+GATE_GARBAGE_THRESHOLD = 0.6
+
 def load_pth_model(pth_model_path):
+    import_ml_libraries()
     model = models.efficientnet_b5(pretrained=False)
     model.load_state_dict(torch.load(pth_model_path, map_location=torch.device("cpu")))
     model.eval()
+    model.requires_grad_(False)
     return model
 
-def capture_image(picam2):
-    print("Adjusting focus... Please hold the object steady.")
-    picam2.set_controls({"AfMode": 1})
-    picam2.autofocus_cycle()
+def load_gate_model(gate_model_path):
+    import_ml_libraries()
+    model = models.mobilenet_v3_small()
+    model.load_state_dict(torch.load(gate_model_path, map_location=torch.device("cpu")))
+    model.eval()
+    model.requires_grad_(False)
+    return model
 
-    print("Locked! Capturing image...")
-    i = 1
-    while os.path.exists(f"test{i}.jpg"):
-        i += 1
-    image_path = f"test{i}.jpg"
+def load_pkl_model(pkl_model_path):
+    import_ml_libraries()
+    learn = load_learner(pkl_model_path)
+    learn.model.eval()
+    learn.model.requires_grad_(False)
+    return learn
 
-    picam2.capture_file(image_path)
-    print(f"Image captured: {image_path}")
-    return image_path
+def garbage_batch(learn, frames):
+    # Input batch for the garbage model, made by the learner's own item and batch transforms
+    import_ml_libraries()
+    dl = learn.dls.test_dl([PILImage.create(frame) for frame in frames], bs=len(frames))
+    return dl.one_batch()[0].as_subclass(torch.Tensor)
 
-def classify_with_pth(model, image_path):
-    transform = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+## Model registry ##
+# Each model is loaded once per process on first use (or by warm_up_models) and stays resident.
+# The classifiers run through the inference backend chosen for their layer (see inference_backends).
+GATE_BACKEND = "eager"
+FIRST_LAYER_BACKEND = "eager"
+GARBAGE_BACKEND = "eager"
 
-    img = Image.open(image_path).convert("RGB")
-    img_tensor = transform(img).unsqueeze(0)
+MODEL_LOADERS = {
+    "gate": lambda: create_backend(
+        GATE_BACKEND,
+        lambda: load_gate_model(GATE_MODEL_PATH),
+        "gate",
+        torch.zeros(1, 3, CROP_SIZE, CROP_SIZE),
+        GATE_MODEL_PATH
+    ),
+    "first_layer": lambda: create_backend(
+        FIRST_LAYER_BACKEND,
+        lambda: load_pth_model(PTH_MODEL_PATH),
+        "first_layer",
+        torch.zeros(1, 3, CROP_SIZE, CROP_SIZE),
+        PTH_MODEL_PATH
+    ),
+    "garbage": lambda: load_pkl_model(PKL_MODEL_PATH),
+    "garbage_backend": lambda: create_backend(
+        GARBAGE_BACKEND,
+        lambda: get_model("garbage").model,
+        "garbage",
+        garbage_batch(get_model("garbage"), [np.zeros((CAMERA_SIZE[1], CAMERA_SIZE[0], 3), dtype=np.uint8)]),
+        PKL_MODEL_PATH
+    )
+}
+loaded_models = {}
+failed_models = {}  # name -> exception, so a missing model file is not retried on every burst
+model_stats = {}
+model_lock = threading.RLock()  # Reentrant: the garbage backend loads the garbage learner first
 
-    with torch.no_grad():
-        outputs = model(img_tensor)
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in kB on Linux
 
-    probabilities = torch.nn.functional.softmax(outputs[0], dim=0)
-    confidence, predicted_class = probabilities.max(0)
+def parameter_mb(model):
+    module = model.model if hasattr(model, "model") else model
+    if module is None:
+        return 0.0  # ONNX Runtime holds the weights outside torch
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers())) / 2**20
 
-    class_name = IMAGENET_CLASSES[predicted_class.item()]
+def get_model(name):
+    import_ml_libraries()
+    with model_lock:
+        if name in failed_models:
+            raise failed_models[name]
+        if name not in loaded_models:
+            print(f"Loading {name} model...")
+            rss_before = max_rss_mb()
+            start = time.perf_counter()
+            try:
+                model = MODEL_LOADERS[name]()
+            except Exception as e:
+                print(f"Failed to load {name} model, not retrying: {e}")
+                failed_models[name] = e
+                raise
+            model_stats[name] = {
+                'load_time_s': time.perf_counter() - start,
+                'parameter_mb': parameter_mb(model),
+                'rss_increase_mb': max_rss_mb() - rss_before
+            }
+            loaded_models[name] = model
+            print(f"Loaded {name} model in {model_stats[name]['load_time_s']:.1f} s "
+                  f"({model_stats[name]['parameter_mb']:.0f} MB of weights)")
+        return loaded_models[name]
 
-    print(f"First layer: {class_name} (Confidence: {confidence:.2f})")
+def warm_up_models():
+    for name in MODEL_LOADERS:
+        try:
+            get_model(name)
+        except Exception:
+            pass  # Reported by get_model
 
-    if confidence < CONFIDENCE_THRESHOLD:
-        print("Low confidence. Retrying...")
-        return None
+def get_model_stats():
+    with model_lock:
+        return {name: dict(stats) for name, stats in model_stats.items()}
 
-    return class_name
-def classify_with_pkl(model_path, image_path):
-    try:
-        learn = load_learner(model_path)
-    except Exception as e:
-        print(f"Failed to load model: {e}")
-        return None, 0.0
+## First layer preprocessing ##
+# Same as Resize(256), CenterCrop(224), ToTensor and Normalize, done on the in-memory frame
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+IMAGENET_MEAN = None  # Set by import_ml_libraries
+IMAGENET_STD = None
+
+@lru_cache(maxsize=8)
+def resize_and_crop_box(height, width):
+    # Resize the short side to RESIZE_SIZE keeping the aspect ratio, then crop the centre
+    if height <= width:
+        size = (RESIZE_SIZE, int(RESIZE_SIZE * width / height))
+    else:
+        size = (int(RESIZE_SIZE * height / width), RESIZE_SIZE)
+    top = int(round((size[0] - CROP_SIZE) / 2.0))
+    left = int(round((size[1] - CROP_SIZE) / 2.0))
+    return size, top, left
+
+def frame_to_tensor(frame):
+    # (height, width, 3) uint8 RGB frame to a normalized (1, 3, 224, 224) tensor, without copying the frame
+    import_ml_libraries()
+    size, top, left = resize_and_crop_box(*frame.shape[:2])
+    img = torch.from_numpy(frame).permute(2, 0, 1).unsqueeze(0).float()
+    img = torch.nn.functional.interpolate(img, size=size, mode="bilinear", align_corners=False, antialias=True)
+    img = img[:, :, top:top + CROP_SIZE, left:left + CROP_SIZE]
+    return (img / 255 - IMAGENET_MEAN) / IMAGENET_STD
+
+def capture_burst(camera, count):
+    # Focus once, then grab frames back to back
+    print("Adjusting focus... Please hold the object steady.")
+    camera.focus()
+
+    print(f"Locked! Capturing {count} images...")
+    frames = [camera.capture_array() for _ in range(count)]
+    if SAVE_DEBUG_IMAGES:
+        for frame in frames:
+            save_debug_frame(frame)
+    return frames
+
+def classify_with_pth(model, img_batch, layer="First layer"):
+    # One batched forward pass of an ImageNet classifier. Returns (class name, confidence) for every frame.
+    with torch.inference_mode():
+        outputs = model(img_batch)
+
+    probabilities = torch.nn.functional.softmax(outputs, dim=1)
+    confidences, predicted_classes = probabilities.max(1)
+
+    imagenet_classes = load_imagenet_classes()
+    results = [(imagenet_classes[c], p) for c, p in zip(predicted_classes.tolist(), confidences.tolist())]
+    for class_name, confidence in results:
+        print(f"{layer}: {class_name} (Confidence: {confidence:.2f})")
+    return results
+
+def classify_with_pkl(learn, model, frames):
+    # The learner's own transforms prepare the frames rather than reusing the first layer tensors.
+    # PILImage wraps the arrays in memory, nothing is decoded.
+    logits = model(garbage_batch(learn, frames))
+    activation = getattr(learn.loss_func, "activation", None)
+    probabilities = activation(logits) if activation is not None else torch.nn.functional.softmax(logits, dim=1)
+    confidences, predicted_classes = probabilities.max(1)
 
-    img = PILImage.create(image_path)
-    pred, _, probs = learn.predict(img)
-    confidence = probs.max().item()
+    results = [(learn.dls.vocab[c], p) for c, p in zip(predicted_classes.tolist(), confidences.tolist())]
+    for pred, confidence in results:
+        print(f"Second layer: {pred} (Confidence: {confidence:.2f})")
+    return results
 
-    print(f"Second layer: {pred} (Confidence: {confidence:.2f})")
-    return pred, confidence
+def vote(results, min_confidence=0.0):
+    # Confidence-weighted vote over (label, confidence) pairs. Returns the winning label, the mean
+    # confidence of the frames that voted for it and the indices of those frames.
+    weights = {}
+    for i, (label, confidence) in enumerate(results):
+        if confidence >= min_confidence:
+            weights.setdefault(label, []).append(i)
+    if not weights:
+        return None, 0.0, []
+
+    winner = max(weights, key=lambda label: sum(results[i][1] for i in weights[label]))
+    voters = weights[winner]
+    return winner, sum(results[i][1] for i in voters) / len(voters), voters
 
 def is_non_garbage_item(item):
     return item.lower() in NON_GARBAGE_CLASSES
 
-def run_ml_pipeline():
-    warnings.filterwarnings("ignore")
-    pth_model_path = "first_layer.pth"
-    pkl_model_path = "garbage_model.pkl"
+## Cascade statistics ##
+# Outcome counts and time spent per stage, to tune the gate thresholds against average latency
+CASCADE_OUTCOMES = {
+    'gate': ("non_garbage", "garbage", "uncertain", "unavailable"),
+    'first_layer': ("non_garbage", "garbage", "low_confidence"),
+    'garbage': ("collect", "leave")
+}
+cascade_stats = {stage: {'runs': 0, 'time_s': 0.0, **dict.fromkeys(outcomes, 0)} for stage, outcomes in CASCADE_OUTCOMES.items()}
+cascade_stats['bursts'] = {'runs': 0, 'time_s': 0.0}
+cascade_lock = threading.Lock()
+
+def record_stage(stage, outcome, start):
+    with cascade_lock:
+        stats = cascade_stats[stage]
+        stats['runs'] += 1
+        stats['time_s'] += time.perf_counter() - start
+        if outcome is not None:
+            stats[outcome] += 1
 
-    pth_model = load_pth_model(pth_model_path)
+def get_cascade_stats():
+    # Per stage: run count, mean latency and the fraction of runs ending in each outcome
+    with cascade_lock:
+        report = {}
+        for stage, stats in cascade_stats.items():
+            runs = stats['runs']
+            report[stage] = dict(stats, mean_ms=stats['time_s'] / runs * 1000 if runs else 0.0)
+            for outcome in CASCADE_OUTCOMES.get(stage, ()):
+                report[stage][f"{outcome}_rate"] = stats[outcome] / runs if runs else 0.0
+        return report
 
+def gate_burst(img_batch):
+    # Returns ("non_garbage" | "garbage" | "uncertain", label, voters) from the gate model. A decision needs a
+    # confident vote from a majority of the burst.
+    start = time.perf_counter()
     try:
-        picam2 = Picamera2(0)
-        config = picam2.create_preview_configuration(main={"size": (640, 480)})
-        picam2.configure(config)
-        picam2.start()
+        gate_model = get_model("gate")
+    except Exception:
+        # Reported once by get_model, every later burst goes straight to the first layer
+        record_stage("gate", "unavailable", start)
+        return "uncertain", None, []
 
-        print("Detection started...")
-        retry_count = 0
+    detected_object, confidence, voters = vote(classify_with_pth(gate_model, img_batch, "Gate"))
+    decision = "uncertain"
+    if 2 * len(voters) > len(img_batch):
+        if is_non_garbage_item(detected_object):
+            if confidence >= GATE_NON_GARBAGE_THRESHOLD:
+                decision = "non_garbage"
+        elif confidence >= GATE_GARBAGE_THRESHOLD:
+            decision = "garbage"
+    print(f"Gate vote: {detected_object} (Confidence: {confidence:.2f}, {len(voters)}/{len(img_batch)} frames) -> {decision}")
+    record_stage("gate", decision, start)
+    return decision, detected_object, voters
 
-        while True:
-            image_path = capture_image(picam2)
-            detected_object = classify_with_pth(pth_model, image_path)
+def classify_burst(frames):
+    # Returns True for garbage, False for non-garbage, or None if the first layer was not
+    # confident on any frame
+    start = time.perf_counter()
+    try:
+        return cascade_burst(frames)
+    finally:
+        record_stage("bursts", None, start)
 
-            if detected_object is None:
-                retry_count += 1
-                if retry_count >= MAX_RETRIES:
-                    print("Stopping after max retries.")
-                    return False
-                continue
+def cascade_burst(frames):
+    img_batch = torch.cat([frame_to_tensor(frame) for frame in frames])
 
-            if is_non_garbage_item(detected_object):
-                print(f"Detected non-garbage object: {detected_object}.")
-                return False
+    decision, detected_object, voters = gate_burst(img_batch) if GATE_ENABLED else ("uncertain", None, [])
+    if decision == "non_garbage":
+        print(f"Gate detected non-garbage object: {detected_object}.")
+        return False
 
-            print(f"Passing {detected_object} to the garbage classifier...")
-            pred, confidence = classify_with_pkl(pkl_model_path, image_path)
+    if decision == "uncertain":
+        start = time.perf_counter()
+        pth_model = get_model("first_layer")
+        detected_object, confidence, voters = vote(classify_with_pth(pth_model, img_batch), CONFIDENCE_THRESHOLD)
 
-            return confidence >= SECOND_LAYER_THRESHOLD
+        if detected_object is None:
+            print("Low confidence on every frame.")
+            record_stage("first_layer", "low_confidence", start)
+            return None
 
-    finally:
-        print("Cleaning up camera...")
-        try:
-            picam2.stop()
-            picam2.close()
-        except Exception as e:
-            print(f"Camera cleanup error: {e}")
+        print(f"First layer vote: {detected_object} (Confidence: {confidence:.2f}, {len(voters)}/{len(frames)} frames)")
+        if is_non_garbage_item(detected_object):
+            print(f"Detected non-garbage object: {detected_object}.")
+            record_stage("first_layer", "non_garbage", start)
+            return False
+        record_stage("first_layer", "garbage", start)
+
+    print(f"Passing {detected_object} to the garbage classifier...")
+    start = time.perf_counter()
+    try:
+        learn = get_model("garbage")
+        garbage_model = get_model("garbage_backend")
+    except Exception as e:
+        print(f"Failed to load model: {e}")
+        return False
+    pred, confidence, _ = vote(classify_with_pkl(learn, garbage_model, [frames[i] for i in voters]))
+    print(f"Second layer vote: {pred} (Confidence: {confidence:.2f})")
+
+    collect = confidence >= SECOND_LAYER_THRESHOLD
+    record_stage("garbage", "collect" if collect else "leave", start)
+    return collect
+
+def run_ml_pipeline(signature=None, classify=classify_burst):
+    # signature is the (world x mm, world y mm, width mm) of the object, used with the frame hash to
+    # recognise objects that were already classified. classify runs on each burst of frames.
+    warnings.filterwarnings("ignore")
+
+    try:
+        camera = start_camera()
 
-        print("ML pipeline finished.")
\ No newline at end of file
+        print("Detection started...")
+        frame_hash = None
+        for _ in range(MAX_BURSTS):
+            frames = capture_burst(camera, BURST_SIZE)
+            if frame_hash is None:
+                frame_hash = dhash(frames[0])
+                cached = classification_cache.lookup(frame_hash, signature)
+                if cached is not None:
+                    print(f"Recognised object from an earlier pass: {'garbage' if cached else 'non-garbage'}.")
+                    return cached
+
+            result = classify(frames)
+            if result is not None:
+                classification_cache.store(frame_hash, result, signature)
+                return result
+            print("Refocusing...")
+
+        print("Stopping after max bursts.")
+        return False
+
+    finally:
+        print("ML pipeline finished.")
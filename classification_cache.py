@@ -0,0 +1,99 @@
+# Import libraries
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+## Classification result cache ##
+# The sweep passes the same objects (chair legs, plant pots) again and again. Verdicts are cached
+# under a perceptual hash of the frame so a recognisable repeat skips both classifiers. An entry
+# can also carry a signature of the object, its world position and LiDAR width (x mm, y mm, width mm),
+# which must match too. The position comes from the robot pose, so the same object seen from another
+# lane still matches.
+HASH_SIZE = 8               # dHash of HASH_SIZE x HASH_SIZE bits
+MAX_HAMMING_DISTANCE = 6    # Bits that may differ between two frames of the same object
+SIGNATURE_TOLERANCE_MM = (200, 200, 40)  # Allowed difference in x, y and width
+CACHE_SIZE = 64
+CACHE_TTL_S = 600
+
+def dhash(frame, size=HASH_SIZE):
+    # Difference hash: shrink to (size + 1) x size grey pixels and keep one bit per horizontal
+    # gradient. Robust to exposure, focus and small shifts, cheap to compare.
+    grey = np.asarray(Image.fromarray(frame).convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (grey[:, 1:] > grey[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+def signature_matches(a, b, tolerance=SIGNATURE_TOLERANCE_MM):
+    # Entries without a signature match any object
+    if a is None or b is None:
+        return True
+    return all(abs(x - y) <= t for x, y, t in zip(a, b, tolerance))
+
+class ClassificationCache:
+    # Bounded LRU of (frame hash, signature) -> verdict. Entries older than ttl_s are dropped, so an
+    # object that was collected or moved is classified again on a later pass.
+    def __init__(self, max_entries=CACHE_SIZE, ttl_s=CACHE_TTL_S, max_distance=MAX_HAMMING_DISTANCE,
+                 tolerance=SIGNATURE_TOLERANCE_MM):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.max_distance = max_distance
+        self.tolerance = tolerance
+        self.entries = OrderedDict()  # (frame hash, signature) -> (verdict, stored at)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expirations': 0}
+
+    def _expire(self, now):
+        # Entries are in least recently used order, not insertion order, so check them all
+        expired = [key for key, (_, stored_at) in self.entries.items() if now - stored_at > self.ttl_s]
+        for key in expired:
+            del self.entries[key]
+        self.stats['expirations'] += len(expired)
+
+    def lookup(self, frame_hash, signature=None):
+        # Verdict of the closest cached frame within max_distance bits, or None on a miss
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            best_key, best_distance = None, self.max_distance + 1
+            for key in self.entries:
+                distance = hamming_distance(frame_hash, key[0])
+                if distance < best_distance and signature_matches(signature, key[1], self.tolerance):
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(best_key)
+            self.stats['hits'] += 1
+            return self.entries[best_key][0]
+
+    def store(self, frame_hash, verdict, signature=None):
+        with self.lock:
+            key = (frame_hash, None if signature is None else tuple(signature))
+            self.entries[key] = (verdict, time.monotonic())
+            self.entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+classification_cache = ClassificationCache()
+
+def get_cache_stats():
+    return classification_cache.get_stats()
@@ -1,15 +1,23 @@
 # Import GPIO library
 from gpiozero import OutputDevice
 
-# Declare GPIO pins as outputs
-pin23 = OutputDevice(23)
-pin24 = OutputDevice(24)
-pin25 = OutputDevice(25)
-
-# Default GPIO output: 000
-pin23.off()
-pin24.off()
-pin25.off()
+# GPIO output pins, claimed by init_gpio
+pin23 = None
+pin24 = None
+pin25 = None
+
+def init_gpio(pin_factory=None):
+    # Declare GPIO pins as outputs
+    global pin23, pin24, pin25
+    if pin23 is None:
+        pin23 = OutputDevice(23, pin_factory=pin_factory)
+        pin24 = OutputDevice(24, pin_factory=pin_factory)
+        pin25 = OutputDevice(25, pin_factory=pin_factory)
+
+    # Default GPIO output: 000
+    pin23.off()
+    pin24.off()
+    pin25.off()
 
 # Motor control functions
 def stop_moving():  
@@ -0,0 +1,252 @@
+# Import libraries
+import time
+import threading
+from collections import namedtuple
+
+## BNO055 driver ##
+BNO055_ADDRESS = 0x28
+BNO055_CHIP_ID = 0xA0
+BNO055_CHIP_ID_ADDR = 0x00
+BNO055_PAGE_ID_ADDR = 0x07
+BNO055_UNIT_SEL_ADDR = 0x3B
+BNO055_OPR_MODE_ADDR = 0x3D
+BNO055_PWR_MODE_ADDR = 0x3E
+BNO055_CALIB_STAT_ADDR = 0x35
+
+CONFIGMODE = 0X00
+AMG_MODE = 0X07   # Raw sensors only
+IMU_MODE = 0X08   # Gyro and accelerometer fusion, relative heading
+NDOF_MODE = 0X0C  # Nine degrees of freedom fusion, absolute heading
+POWER_MODE_NORMAL = 0x00
+UNITS = 0x00      # m/s^2, degrees/s, degrees, Celsius, Windows orientation (heading grows clockwise)
+
+GYRO_Z_ADDR = 0x18
+EULER_HEADING_ADDR = 0x1A
+LSB_PER_DEGREE = 16  # Both gyro (degrees/s) and Euler angles (degrees) in the units above
+
+# One block read per sample covers gyro Z (0x18-0x19), the Euler heading (0x1A-0x1B) and, after the
+# quaternion, linear acceleration, gravity and temperature registers, the calibration status (0x35)
+SAMPLE_BLOCK_ADDR = GYRO_Z_ADDR
+SAMPLE_BLOCK_LENGTH = BNO055_CALIB_STAT_ADDR - GYRO_Z_ADDR + 1
+
+# rate: raw gyro Z rate in degrees/s, heading: fused heading in degrees (0 to 360, None without fusion),
+# calibration: (system, gyro, accelerometer, magnetometer) status from 0 to 3.
+# Turns follow the sign of gyro Z as read (right turns positive). The chip's Euler heading grows the
+# other way, so it is mirrored to match.
+ImuReading = namedtuple("ImuReading", "rate heading calibration")
+
+def parse_calibration(status):
+    return (status >> 6 & 3, status >> 4 & 3, status >> 2 & 3, status & 3)
+
+class BNO055:
+    # Configures the BNO055 for on-chip fusion and reads each sample in a single I2C transaction.
+    # If the chip does not enter the fusion mode, heading is left to gyro integration.
+    def __init__(self, bus, address=BNO055_ADDRESS, mode=NDOF_MODE):
+        self.bus = bus
+        self.address = address
+        self.mode = mode
+        self.fusion = False
+
+    def begin(self, boot_timeout=1.0):
+        deadline = time.monotonic() + boot_timeout
+        while self._read_byte(BNO055_CHIP_ID_ADDR) != BNO055_CHIP_ID:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No BNO055 found at address {self.address:#04x}")
+            time.sleep(0.05)  # Still booting
+
+        self._set_mode(CONFIGMODE)
+        self.bus.write_byte_data(self.address, BNO055_PWR_MODE_ADDR, POWER_MODE_NORMAL)
+        self.bus.write_byte_data(self.address, BNO055_PAGE_ID_ADDR, 0)
+        self.bus.write_byte_data(self.address, BNO055_UNIT_SEL_ADDR, UNITS)
+        self._set_mode(self.mode)
+
+        self.fusion = self._read_byte(BNO055_OPR_MODE_ADDR) & 0x0F == self.mode
+        if not self.fusion:
+            print("BNO055 did not enter fusion mode, integrating the gyro instead.")
+        return self.fusion
+
+    def _read_byte(self, register):
+        return self.bus.read_byte_data(self.address, register)
+
+    def _set_mode(self, mode):
+        self.bus.write_byte_data(self.address, BNO055_OPR_MODE_ADDR, mode)
+        time.sleep(0.03)  # Mode switches take up to 19 ms
+
+    def read_sample(self):
+        data = bytes(self.bus.read_i2c_block_data(self.address, SAMPLE_BLOCK_ADDR, SAMPLE_BLOCK_LENGTH))
+        rate = int.from_bytes(data[0:2], byteorder='little', signed=True) / LSB_PER_DEGREE
+        heading = None
+        if self.fusion:
+            offset = EULER_HEADING_ADDR - SAMPLE_BLOCK_ADDR
+            euler_heading = int.from_bytes(data[offset:offset + 2], byteorder='little', signed=True) / LSB_PER_DEGREE
+            heading = (360 - euler_heading) % 360
+        return ImuReading(rate, heading, parse_calibration(data[-1]))
+
+class Bno055Emulator:
+    # Stand-in for an SMBus with a BNO055 on it, emulating the register map. Set gyro_z (degrees/s)
+    # and the fusion modes turn the Euler heading to match. Counts block reads so tests can check
+    # the I2C traffic.
+    def __init__(self, address=BNO055_ADDRESS, calibration=0xFF, fusion=True):
+        self.address = address
+        self.fusion = fusion  # False emulates a chip that stays in a non-fusion mode
+        self.registers = bytearray(0x80)
+        self.registers[BNO055_CHIP_ID_ADDR] = BNO055_CHIP_ID
+        self.registers[BNO055_CALIB_STAT_ADDR] = calibration
+        self.gyro_z = 0.0
+        self.heading = 0.0
+        self.last_update = time.monotonic()
+        self.block_reads = 0
+
+    def _check(self, address):
+        if address != self.address:
+            raise OSError(121, "Remote I/O error")  # No device acknowledged
+
+    def _update(self):
+        now = time.monotonic()
+        mode = self.registers[BNO055_OPR_MODE_ADDR] & 0x0F
+        if mode != CONFIGMODE:
+            # Heading grows clockwise, the gyro is positive counterclockwise about Z
+            self.heading = (self.heading - self.gyro_z * (now - self.last_update)) % 360
+            rate = round(self.gyro_z * LSB_PER_DEGREE)
+            self.registers[GYRO_Z_ADDR:GYRO_Z_ADDR + 2] = rate.to_bytes(2, byteorder='little', signed=True)
+            if mode in (IMU_MODE, NDOF_MODE):
+                heading = round(self.heading * LSB_PER_DEGREE) % (360 * LSB_PER_DEGREE)
+                self.registers[EULER_HEADING_ADDR:EULER_HEADING_ADDR + 2] = heading.to_bytes(2, byteorder='little')
+        self.last_update = now
+
+    def read_byte_data(self, address, register):
+        self._check(address)
+        self._update()
+        return self.registers[register]
+
+    def write_byte_data(self, address, register, value):
+        self._check(address)
+        self._update()
+        if register == BNO055_OPR_MODE_ADDR and not self.fusion and value != CONFIGMODE:
+            value = AMG_MODE
+        self.registers[register] = value
+
+    def read_i2c_block_data(self, address, register, length):
+        self._check(address)
+        if length > 32:
+            raise ValueError("SMBus block reads are limited to 32 bytes")
+        self._update()
+        self.block_reads += 1
+        return list(self.registers[register:register + length])
+
+    def close(self):
+        pass
+
+## IMU sampler ##
+# One thread reads the IMU at a fixed rate, filters the yaw rate and tracks the heading, from the
+# fused heading when there is one or by integrating with the measured time step. Turning, deviation tracking and the pose all read the published snapshot instead of
+# going to the I2C bus themselves.
+IMU_RATE_HZ = 100            # Gyro samples per second
+FILTER_TIME_CONSTANT = 0.05  # Low pass filter (s), smooths noise without lagging turns
+GYRO_DEADZONE = 0.2          # Rudimentary high pass filter (degrees/s)
+
+# heading: yaw in degrees since the sampler started, clockwise positive and not wrapped
+# rate: filtered angular velocity in degrees/s
+# fused: whether heading follows the IMU's own fusion rather than gyro integration
+ImuSnapshot = namedtuple("ImuSnapshot", "timestamp heading rate samples fused calibration")
+
+def normalize_angle(angle):
+    # Wrap to [-180, 180) degrees
+    return (angle + 180) % 360 - 180
+
+class ImuSampler:
+    # read_sample() returns an ImuReading. When it carries a fused heading the sampler follows it,
+    # otherwise it integrates the filtered rate. The heading stays continuous across either switch.
+    def __init__(self, read_sample, rate_hz=IMU_RATE_HZ, time_constant=FILTER_TIME_CONSTANT, deadzone=GYRO_DEADZONE):
+        self.read_sample = read_sample
+        self.period = 1 / rate_hz
+        self.time_constant = time_constant
+        self.deadzone = deadzone
+        self.filtered_rate = 0.0
+        self.heading = 0.0
+        self.last_fused_heading = None
+        self.errors = 0
+        self.overruns = 0
+        self.latest = ImuSnapshot(time.monotonic(), 0.0, 0.0, 0, False, None)
+        self.sample_callbacks = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add_sample_callback(self, callback):
+        # callback(snapshot) runs in the sampler thread after every sample, so it must be quick
+        if callback not in self.sample_callbacks:
+            self.sample_callbacks.append(callback)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def snapshot(self):
+        return self.latest
+
+    def _run(self):
+        last_time = time.monotonic()
+        next_time = last_time + self.period
+        samples = 0
+        while not self.stop_event.is_set():
+            try:
+                reading = self.read_sample()
+            except OSError as e:
+                # A failed I2C read skips the sample, the next one integrates over the gap
+                self.errors += 1
+                if self.errors == 1 or self.errors % 100 == 0:
+                    print(f"IMU read failed ({self.errors} errors): {e}")
+                reading = None
+
+            now = time.monotonic()
+            if reading is not None:
+                dt = now - last_time
+                last_time = now
+                rate = self._integrate(reading, dt)
+                samples += 1
+                self.latest = ImuSnapshot(now, self.heading, rate, samples, self.last_fused_heading is not None,
+                                          reading.calibration)
+                for callback in self.sample_callbacks:
+                    try:
+                        callback(self.latest)
+                    except Exception as e:
+                        print(f"IMU sample callback error: {e}")
+
+            # Fixed rate against absolute deadlines, resynchronised after an overrun
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                self.overruns += 1
+                next_time = time.monotonic() + self.period
+                delay = self.period
+            self.stop_event.wait(delay)
+
+    def _integrate(self, reading, dt):
+        # Low pass filter with a fixed time constant, whatever the sample interval
+        alpha = dt / (self.time_constant + dt)
+        self.filtered_rate = alpha * reading.rate + (1 - alpha) * self.filtered_rate
+        # Rudimentary high pass filter on the output, so the filter itself can still settle
+        rate = self.filtered_rate if abs(self.filtered_rate) >= self.deadzone else 0.0
+
+        if reading.heading is not None:
+            # Follow the fused heading by its change since the last sample
+            if self.last_fused_heading is not None:
+                self.heading += normalize_angle(reading.heading - self.last_fused_heading)
+            self.last_fused_heading = reading.heading
+        else:
+            # Integrate angular velocity to calculate heading
+            self.last_fused_heading = None
+            self.heading += rate * dt
+        return rate
@@ -0,0 +1,102 @@
+# Import libraries
+import os
+import torch
+
+## Optimized CPU inference backends ##
+# Every backend is called with a float batch tensor and returns the logits as a tensor.
+#   eager       - the model as loaded (float32, eager mode)
+#   torchscript - traced with torch.jit and cached
+#   quantized   - dynamic int8 quantization of the Linear layers, traced and cached
+#   onnx        - exported to ONNX and run with ONNX Runtime
+BACKENDS = ("eager", "torchscript", "quantized", "onnx")
+BACKEND_CACHE_DIR = "model_cache"
+
+class EagerBackend:
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, batch):
+        with torch.inference_mode():
+            return self.model(batch)
+
+class TorchScriptBackend:
+    def __init__(self, scripted):
+        self.model = scripted
+
+    def __call__(self, batch):
+        with torch.inference_mode():
+            return self.model(batch)
+
+class OnnxBackend:
+    def __init__(self, path):
+        # Imported here so onnxruntime is only needed when this backend is selected
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.model = None
+
+    def __call__(self, batch):
+        outputs = self.session.run(None, {self.input_name: batch.contiguous().numpy()})
+        return torch.from_numpy(outputs[0])
+
+def cache_path(model_name, backend):
+    extension = "onnx" if backend == "onnx" else "pt"
+    return os.path.join(BACKEND_CACHE_DIR, f"{model_name}.{backend}.{extension}")
+
+def is_cache_fresh(path, source_path):
+    # A cached export is stale once the source weights are newer
+    if not os.path.exists(path):
+        return False
+    return source_path is None or not os.path.exists(source_path) or os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+def export_backend(backend, model, model_name, example_input):
+    # One-time export of a model to the cache for the given backend. Returns the cache path.
+    os.makedirs(BACKEND_CACHE_DIR, exist_ok=True)
+    path = cache_path(model_name, backend)
+    model.eval()
+    example_input = example_input.as_subclass(torch.Tensor)
+
+    if backend == "torchscript":
+        with torch.inference_mode():
+            traced = torch.jit.freeze(torch.jit.trace(model, example_input))
+        traced.save(path)
+    elif backend == "quantized":
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        with torch.inference_mode():
+            traced = torch.jit.trace(quantized, example_input)
+        traced.save(path)
+    elif backend == "onnx":
+        options = dict(
+            input_names=["input"], output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17
+        )
+        try:
+            # The TorchScript-based exporter: newer torch defaults to the dynamo exporter, which needs onnxscript
+            torch.onnx.export(model, example_input, path, dynamo=False, **options)
+        except TypeError:
+            torch.onnx.export(model, example_input, path, **options)  # torch before 2.5 has no dynamo flag
+    else:
+        raise ValueError(f"Backend {backend} has nothing to export")
+
+    print(f"Exported {model_name} to {path}")
+    return path
+
+def create_backend(backend, load_model, model_name, example_input, source_path=None):
+    # load_model() returns the eager torch module. It is only called when the backend needs it,
+    # so a fresh cached export loads without building the eager model first.
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {BACKENDS}")
+
+    if backend == "eager":
+        return EagerBackend(load_model())
+
+    path = cache_path(model_name, backend)
+    if not is_cache_fresh(path, source_path):
+        export_backend(backend, load_model(), model_name, example_input)
+
+    if backend == "onnx":
+        return OnnxBackend(path)
+    return TorchScriptBackend(torch.jit.load(path, map_location="cpu"))
@@ -0,0 +1,223 @@
+# Import libraries
+import queue
+import threading
+import multiprocessing
+from math import prod
+from multiprocessing import shared_memory
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+# Import modules
+from camera import CAMERA_SIZE
+from classification import BURST_SIZE, run_ml_pipeline, get_cascade_stats, get_model_stats
+
+## Out-of-process classification ##
+# The classifiers run in a separate process so a forward pass never holds the GIL that the encoder
+# callbacks, IMU and LiDAR threads need. Frames are copied into shared memory slots and each
+# request's verdict comes back as a future.
+FRAME_SHAPE = (CAMERA_SIZE[1], CAMERA_SIZE[0], 3)
+WORKER_POLL_S = 0.5       # How often the collector checks that the worker process is still alive
+MAX_WORKER_RESTARTS = 1   # After this many deaths (e.g. out of memory loading a model), classify in process
+
+def classification_stats():
+    return {'cascade': get_cascade_stats(), 'models': get_model_stats()}
+
+def worker_main(shm_name, slot_bytes, requests, results):
+    # Entry point of the worker process: load the models once, then classify bursts until told to stop
+    import classification
+    classification.warm_up_models()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    results.put(("ready", None, None))
+
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            request_id, slot, count, shape = request
+            if slot is None:
+                # Statistics request, no frames attached
+                results.put((request_id, classification_stats(), None))
+                continue
+            frames = np.ndarray((count, *shape), dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            try:
+                results.put((request_id, classification.classify_burst(list(frames)), None))
+            except Exception as e:
+                results.put((request_id, None, repr(e)))
+            del frames
+    finally:
+        shm.close()
+
+class ClassificationWorker:
+    def __init__(self, frame_shape=FRAME_SHAPE, max_frames=BURST_SIZE, slots=2):
+        self.frame_shape = frame_shape
+        self.max_frames = max_frames
+        self.slot_bytes = prod(frame_shape) * max_frames
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slots)
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+
+        # Spawn rather than fork: the parent already runs sensor threads
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(
+            target=worker_main, args=(self.shm.name, self.slot_bytes, self.requests, self.results), daemon=True
+        )
+        self.ready = threading.Event()
+        self.failure = None  # Set once the worker process has died
+        self.stopping = False
+        self.pending = {}  # request id -> (future, slot)
+        self.pending_lock = threading.Lock()
+        self.next_request_id = 0
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+
+    def start(self):
+        self.process.start()
+        self.collector.start()
+
+    def submit(self, frames):
+        # Copy the frames into a free shared memory slot and return a future for the verdict
+        # (True for garbage, False for non-garbage, None if the first layer was not confident)
+        if len(frames) > self.max_frames or any(frame.shape != self.frame_shape for frame in frames):
+            raise ValueError(f"Expected up to {self.max_frames} frames of shape {self.frame_shape}")
+
+        slot = self.free_slots.get()  # Waits while every slot is in use, or until the worker dies
+        if self.failure is not None:
+            self.free_slots.put(slot)
+            raise self.failure
+        view = np.ndarray((len(frames), *self.frame_shape), dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+        for i, frame in enumerate(frames):
+            view[i] = frame
+        del view
+
+        return self._request(slot, len(frames), self.frame_shape)
+
+    def get_stats(self):
+        # Future for the worker's cascade and model statistics
+        return self._request(None, 0, None)
+
+    def _request(self, slot, count, shape):
+        future = Future()
+        with self.pending_lock:
+            if self.failure is not None:
+                if slot is not None:
+                    self.free_slots.put(slot)
+                raise self.failure
+            request_id = self.next_request_id
+            self.next_request_id += 1
+            self.pending[request_id] = (future, slot)
+        self.requests.put((request_id, slot, count, shape))
+        return future
+
+    def is_alive(self):
+        return self.failure is None and self.process.is_alive()
+
+    def _collect(self):
+        while True:
+            try:
+                request_id, result, error = self.results.get(timeout=WORKER_POLL_S)
+            except queue.Empty:
+                if not self.process.is_alive() and not self.stopping:
+                    self._fail(RuntimeError(f"Classification worker exited with code {self.process.exitcode}"))
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+            if request_id == "ready":
+                self.ready.set()
+                continue
+            if request_id is None:
+                break
+
+            with self.pending_lock:
+                future, slot = self.pending.pop(request_id)
+            if slot is not None:
+                self.free_slots.put(slot)
+            if error is not None:
+                future.set_exception(RuntimeError(f"Classification failed in worker: {error}"))
+            else:
+                future.set_result(result)
+
+    def _fail(self, error):
+        # The worker process died: fail every pending request and hand back its slot, so neither
+        # waiting callers nor later submissions block forever
+        with self.pending_lock:
+            print(f"{error}, failing {len(self.pending)} pending requests.")
+            self.failure = error
+            pending = list(self.pending.values())
+            self.pending.clear()
+        for future, slot in pending:
+            if slot is not None:
+                self.free_slots.put(slot)
+            future.set_exception(error)
+        self.free_slots.put(None)  # Wakes a submission waiting for a slot
+
+    def stop(self, timeout=5.0):
+        self.stopping = True
+        self.requests.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.results.put((None, None, None))
+        self.collector.join(timeout)
+
+        with self.pending_lock:
+            for future, _ in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.shm.close()
+        self.shm.unlink()
+
+classification_worker = None
+worker_restarts = 0
+pipeline_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ml_pipeline")
+
+def start_classification_worker():
+    global classification_worker
+    if classification_worker is None:
+        classification_worker = ClassificationWorker()
+        classification_worker.start()
+    return classification_worker
+
+def stop_classification_worker():
+    global classification_worker
+    if classification_worker is not None:
+        classification_worker.stop()
+        classification_worker = None
+
+def run_remote_pipeline(worker, signature=None):
+    # Same flow as run_ml_pipeline, with the classification done by the worker process
+    return run_ml_pipeline(signature, lambda frames: worker.submit(frames).result())
+
+def check_classification_worker():
+    # Restart a worker process that died, up to MAX_WORKER_RESTARTS times, then carry on without one
+    global classification_worker, worker_restarts
+    if classification_worker is None or classification_worker.is_alive():
+        return
+    stop_classification_worker()
+    if worker_restarts < MAX_WORKER_RESTARTS:
+        worker_restarts += 1
+        print(f"Restarting the classification worker ({worker_restarts} of {MAX_WORKER_RESTARTS}).")
+        start_classification_worker()
+    else:
+        print("Classification worker keeps dying, classifying in this process instead.")
+
+def submit_ml_pipeline(signature=None):
+    # Capture and classify in the background. Returns a future for True (collect) or False, which
+    # raises if the worker process died during the request.
+    # signature is the object's (world x mm, world y mm, width mm) for the result cache.
+    # Without a worker process the pipeline runs in this process instead.
+    check_classification_worker()
+    if classification_worker is None:
+        return pipeline_executor.submit(run_ml_pipeline, signature)
+    return pipeline_executor.submit(run_remote_pipeline, classification_worker, signature)
+
+def get_classification_stats(timeout=5.0):
+    # Cascade and model statistics from wherever the classifiers run
+    if classification_worker is None:
+        return classification_stats()
+    return classification_worker.get_stats().result(timeout)
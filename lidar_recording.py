@@ -0,0 +1,132 @@
+# Import libraries
+import time
+import numpy as np
+
+## Raw LiDAR recording and replay ##
+
+# File layout: 16 byte header (magic + record count) followed by packed fixed-size records
+RECORDING_MAGIC = b"RPLREC01"
+HEADER_SIZE = 16
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),       # Seconds since the recording started
+    ('quality', 'u1'),
+    ('new_scan', 'u1'),
+    ('angle', '<f4'),      # Degrees
+    ('distance', '<f4')    # mm
+])
+
+class LidarRecorder:
+    # Wraps an RPLidar-like device and writes every measurement from iter_measures to a file
+    # while passing it on unchanged. Use it from a scanner device factory.
+    def __init__(self, device, path, chunk_size=4096):
+        self.device = device
+        self.path = path
+        self.chunk = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self.index = 0  # Records waiting in the chunk
+        self.count = 0  # Records written to the file
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC + np.uint64(0).tobytes())
+
+    def start_motor(self):
+        self.device.start_motor()
+
+    def iter_measures(self, *args, **kwargs):
+        start_time = time.monotonic()
+        try:
+            for measure in self.device.iter_measures(*args, **kwargs):
+                new_scan, quality, angle, distance = measure
+                self.chunk[self.index] = (time.monotonic() - start_time, quality, new_scan, angle, distance)
+                self.index += 1
+                if self.index == len(self.chunk):
+                    self.flush()
+                yield measure
+        finally:
+            self.flush()
+
+    def flush(self):
+        if self.index and not self.file.closed:
+            self.chunk[:self.index].tofile(self.file)
+            self.count += self.index
+        self.index = 0
+
+    def stop(self):
+        self.device.stop()
+
+    def stop_motor(self):
+        self.device.stop_motor()
+
+    def disconnect(self):
+        self.device.disconnect()
+        self.close()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.seek(len(RECORDING_MAGIC))
+        self.file.write(np.uint64(self.count).tobytes())
+        self.file.close()
+
+def recording_factory(device_factory, path):
+    return lambda: LidarRecorder(device_factory(), path)
+
+def load_recording(path):
+    # Memory-map the records of a recording. The count comes from the file size if the
+    # recorder never got to write the header (for example after a crash).
+    with open(path, "rb") as file:
+        header = file.read(HEADER_SIZE)
+        file.seek(0, 2)
+        size = file.tell()
+    if header[:len(RECORDING_MAGIC)] != RECORDING_MAGIC:
+        raise ValueError(f"{path} is not a LiDAR recording")
+
+    count = int(np.frombuffer(header[len(RECORDING_MAGIC):], dtype='<u8')[0])
+    if count == 0:
+        count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+class LidarReplay:
+    # Plays a recording back through the RPLidar interface, either at the recorded pace
+    # (realtime=True) or as fast as the consumer can take it.
+    def __init__(self, path, realtime=True, chunk_size=4096):
+        self.records = load_recording(path)
+        self.realtime = realtime
+        self.chunk_size = chunk_size
+        self.stopped = False
+
+    def start_motor(self):
+        self.stopped = False
+
+    def iter_measures(self, *args, **kwargs):
+        start_time = time.monotonic()
+        for chunk_start in range(0, len(self.records), self.chunk_size):
+            chunk = self.records[chunk_start:chunk_start + self.chunk_size]
+            times = chunk['time'].tolist()
+            for t, quality, new_scan, angle, distance in zip(
+                times,
+                chunk['quality'].tolist(),
+                chunk['new_scan'].tolist(),
+                chunk['angle'].tolist(),
+                chunk['distance'].tolist()
+            ):
+                if self.stopped:
+                    return
+                if self.realtime:
+                    delay = start_time + t - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield bool(new_scan), quality, angle, distance
+
+    def stop(self):
+        self.stopped = True
+
+    def stop_motor(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+def replay_factory(path, realtime=True):
+    return lambda: LidarReplay(path, realtime)
@@ -2,14 +2,30 @@
 import math
 import time
 import threading
+from startup_profile import startup_profile, PROFILE_STARTUP
 
-# Import modules
-from motion import move_forward_until, move_backward_until, turn_left_until, turn_right_until
-from gpio import collect_garbage
-from classification import run_ml_pipeline
-from perception import detect_object_of_interest, is_tall_object_present
-from navigation import (start_path_distance, update_path_distance, reset_path_distance, start_deviation_angle,
-                        update_deviation_angle)
+# Import modules (nothing here touches hardware or loads a model until it is initialised below)
+with startup_profile.stage("motion", "import"):
+    from motion import (move_forward_until, move_backward_until, turn_left_until, turn_right_until, correct_deviation,
+                        collect_garbage)
+with startup_profile.stage("arbiter", "import"):
+    from arbiter import start_motion_arbiter, stop_motion_arbiter, is_motion_arbiter_running
+with startup_profile.stage("gpio", "import"):
+    from gpio import init_gpio
+with startup_profile.stage("inference_worker", "import"):
+    from inference_worker import submit_ml_pipeline, start_classification_worker, stop_classification_worker
+with startup_profile.stage("camera", "import"):
+    from camera import start_camera, stop_camera
+with startup_profile.stage("perception", "import"):
+    from perception import (detect_object_of_interest, is_tall_object_present, start_lidar_scanner, stop_lidar_scanner,
+                            start_range_sampler, stop_range_sampler, open_lidar, set_pose_source)
+with startup_profile.stage("lidar_recording", "import"):
+    from lidar_recording import recording_factory
+with startup_profile.stage("navigation", "import"):
+    from navigation import (init_navigation, start_path_distance, update_path_distance, reset_path_distance,
+                            start_deviation_angle, update_deviation_angle, pose_at, get_pose, stop_imu)
+with startup_profile.stage("mapping", "import"):
+    from mapping import open_map
 
 # Declare parameters (all distances in cm)
 PERIMETER_X = 750
@@ -18,8 +34,28 @@ observed_distance = 50
 observed_angle = math.radians(45)
 side_distance = math.cos(observed_angle) * observed_distance / math.sin(observed_angle)
 collection_distance = 10 # Distance between garbage and LiDAR when collecting garbage
+CLASSIFICATION_TIMEOUT_S = 30  # Covers the worker still loading its models on the first object
 facing_up = True
 
+# Set to a file path to record the raw LiDAR stream for offline replay
+LIDAR_RECORDING_PATH = None
+
+# Occupancy map of the perimeter, kept on disk between runs
+MAP_PATH = "perimeter_map.npy"
+occupancy_map = None
+
+def map_revolution(angles, distances, start_time, end_time):
+    # Pose halfway through the revolution rather than when it is processed
+    pose = pose_at((start_time + end_time) / 2)
+    occupancy_map.integrate_scan(angles, distances, (pose.x, pose.y, pose.heading))
+
+def object_position(object):
+    # World position (cm) of a detected object from the current pose
+    pose_x, pose_y, heading = get_pose()
+    bearing = math.radians(heading + object['relative_angle_deg'])
+    distance = object['distance_mm'] / 10
+    return pose_x + distance * math.sin(bearing), pose_y + distance * math.cos(bearing)
+
 def loop(PERIMETER_X, PERIMETER_Y):
     global facing_up
     
@@ -29,22 +65,33 @@ def loop(PERIMETER_X, PERIMETER_Y):
     
     while True:
         # Travel 50 cm and stop
-        move_forward_until(50, "path", "y")
+        move_forward_until(50)
+        stopped_at = time.monotonic()
         
-        # Run LiDAR scan after stopping
-        object = detect_object_of_interest()
+        # Read LiDAR revolutions captured after stopping
+        object = detect_object_of_interest(since=stopped_at)
         
         if object:
             object_angle = object['relative_angle_deg']
             object_distance = object['distance_mm'] / 10  # Convert to cm
             object_width = object['width_mm'] / 10
+            world_x, world_y = object_position(object)
+            # Recognises repeat sightings in the result cache, from wherever the robot sees the object
+            signature = (world_x * 10, world_y * 10, object['width_mm'])
+            # An object that was already checked this run is not checked or classified again, but one
+            # in the way still has to be driven around
+            handled = occupancy_map is not None and occupancy_map.is_visited(world_x, world_y)
             
             if abs(object_angle) > 10 and object_distance > 20:
                 # Object is off the path (confirm requirements)
-                object_event_off_path(object_distance, object_angle)
+                if not handled:
+                    object_event_off_path(object_distance, object_angle, signature)
             else:
                 # Object is on the path
-                object_event_on_path(object_distance, object_width)
+                object_event_on_path(object_distance, object_width, signature, handled)
+            
+            if occupancy_map is not None:
+                occupancy_map.mark_visited(world_x, world_y, object_width / 2)
         
         distance_travelled_y = update_path_distance("y")
         distance_travelled_x = update_path_distance("x")
@@ -52,11 +99,11 @@ def loop(PERIMETER_X, PERIMETER_Y):
         if distance_travelled_y >= 0.9 * PERIMETER_Y:
             if facing_up:
                 turn_right_until(90)
-                move_forward_until(side_distance * 1.5, "path", "x")
+                move_forward_until(side_distance * 1.5)
                 turn_right_until(90)
             else:
                 turn_left_until(90)
-                move_forward_until(side_distance * 1.5, "path", "x")
+                move_forward_until(side_distance * 1.5)
                 turn_left_until(90)
             
             facing_up = not facing_up
@@ -64,10 +111,10 @@ def loop(PERIMETER_X, PERIMETER_Y):
             start_path_distance("y")
 
         if distance_travelled_x >= 0.9 * PERIMETER_X:
-            move_backward_until(update_path_distance("x"), "path", "x")
+            move_backward_until(update_path_distance("x"))
             if facing_up:
                 turn_left_until(90)
-                move_backward_until(update_path_distance("y"), "path", "y")
+                move_backward_until(update_path_distance("y"))
             else:
                 turn_left_until(90)
                 facing_up = not facing_up
@@ -79,27 +126,45 @@ def loop(PERIMETER_X, PERIMETER_Y):
     
         time.sleep(0.1)
             
-def object_event_off_path(object_distance, object_angle):
+def is_garbage(verdict):
+    # Wait for a classification future. A classification that fails or times out (e.g. the worker
+    # process died) counts as not garbage, so the sweep carries on.
+    if verdict is None:
+        return False
+    try:
+        return bool(verdict.result(timeout=CLASSIFICATION_TIMEOUT_S))
+    except Exception as e:
+        print(f"Classification failed, treating the object as not garbage: {e!r}")
+        return False
+
+def object_event_off_path(object_distance, object_angle, signature=None):
     if object_angle < 0: 
         turn_left_until(-object_angle) 
     else: 
         turn_right_until(object_angle)
     
-    move_forward_until(object_distance - collection_distance, "object")
+    move_forward_until(object_distance - collection_distance)
     
-    if not is_tall_object_present(object_distance * 10) and run_ml_pipeline():
+    # Classification runs in the worker process; only wait for the verdict when it is needed
+    verdict = None if is_tall_object_present(object_distance * 10) else submit_ml_pipeline(signature)
+    if is_garbage(verdict):
         collect_garbage()
         
-    move_backward_until(object_distance - collection_distance, "object")
+    move_backward_until(object_distance - collection_distance)
     
     if object_angle < 0:
         turn_right_until(-object_angle)
     else:
         turn_left_until(object_angle)
         
-def object_event_on_path(object_distance, object_width):
-    move_forward_until(object_distance - collection_distance, "path", "y")
-    if not is_tall_object_present(object_distance * 10) and run_ml_pipeline():
+def object_event_on_path(object_distance, object_width, signature=None, handled=False):
+    # handled: the object was already checked this run and was left there, so only drive around it
+    move_forward_until(object_distance - collection_distance)
+    if handled or is_tall_object_present(object_distance * 10):
+        verdict = None
+    else:
+        verdict = submit_ml_pipeline(signature)
+    if is_garbage(verdict):
         collect_garbage()
     else:
         # Move around object
@@ -107,24 +172,64 @@ def object_event_on_path(object_distance, object_width):
     
 def obstacle_event(object_width):
     turn_right_until(90)
-    move_forward_until(3 * object_width, "path", "x")
+    move_forward_until(3 * object_width)
     turn_left_until(90)
-    move_forward_until(3 * object_width, "path", "y")
+    move_forward_until(3 * object_width)
     turn_right_until(90)
-    move_backward_until(3 * object_width, "path", "x")
+    move_backward_until(3 * object_width)
     turn_left_until(90)
 
 def deviation_angle_correction():
-    while True:
+    # Runs until the motion arbiter is stopped on shutdown
+    while is_motion_arbiter_running():
         deviation = update_deviation_angle()
-        if deviation > 10:
-            turn_left_until(deviation)
-        elif deviation < -10:
-            turn_right_until(-deviation)
+        if abs(deviation) > 10:
+            try:
+                correct_deviation(deviation)
+            except Exception as e:
+                print(f"Deviation correction failed: {e!r}")
         time.sleep(0.1)
 
 if __name__ == "__main__":
-    start_deviation_angle()
-    thread_deviation_correction = threading.Thread(target=deviation_angle_correction, daemon=True)
-    thread_deviation_correction.start()
-    loop(PERIMETER_X, PERIMETER_Y)
\ No newline at end of file
+    with startup_profile.stage("gpio"):
+        init_gpio()
+    with startup_profile.stage("navigation"):
+        init_navigation()
+    with startup_profile.stage("motion arbiter"):
+        start_motion_arbiter()
+    with startup_profile.stage("classification worker"):
+        # The worker process loads the models while the first sweep begins
+        classification_worker = start_classification_worker()
+    # Opening the camera is slow too, so it also happens in the background
+    camera_thread = threading.Thread(target=start_camera, daemon=True)
+    camera_thread.start()
+    with startup_profile.stage("mapping"):
+        occupancy_map = open_map(MAP_PATH, PERIMETER_X, PERIMETER_Y)
+    with startup_profile.stage("perception"):
+        set_pose_source(pose_at)
+        lidar_factory = recording_factory(open_lidar, LIDAR_RECORDING_PATH) if LIDAR_RECORDING_PATH else None
+        start_lidar_scanner(lidar_factory).add_revolution_callback(map_revolution)
+        start_range_sampler()
+    with startup_profile.stage("deviation angle"):
+        start_deviation_angle()
+    startup_profile.mark("Ready to move")
+    print(f"Ready to move after {startup_profile.elapsed():.2f} s.")
+    try:
+        if PROFILE_STARTUP:
+            camera_thread.join()
+            startup_profile.mark("Camera open")
+            classification_worker.ready.wait()
+            startup_profile.mark("Models warm")
+            startup_profile.report()
+        else:
+            thread_deviation_correction = threading.Thread(target=deviation_angle_correction, daemon=True)
+            thread_deviation_correction.start()
+            loop(PERIMETER_X, PERIMETER_Y)
+    finally:
+        stop_motion_arbiter()
+        stop_classification_worker()
+        stop_camera()
+        stop_range_sampler()
+        stop_lidar_scanner()
+        stop_imu()
+        occupancy_map.flush()
@@ -0,0 +1,138 @@
+# Import libraries
+import os
+import json
+import numpy as np
+
+## Occupancy grid map of the perimeter ##
+
+# Map parameters (all distances in cm)
+CELL_SIZE = 5
+MAP_MARGIN = 100  # Extra space around the perimeter for obstacles seen beyond it
+
+# Log-odds updates per observation, clamped so cells can still change their mind
+LOG_ODDS_OCCUPIED = 0.85
+LOG_ODDS_FREE = -0.4
+LOG_ODDS_MIN = -4.0
+LOG_ODDS_MAX = 4.0
+OCCUPIED_THRESHOLD = 1.5
+FREE_THRESHOLD = -1.5
+
+class OccupancyGrid:
+    # Log-odds occupancy grid in world coordinates (x to the right of the starting direction,
+    # y along it, cm). The log-odds can live in a memory-mapped file so the map survives restarts.
+    # The cells whose objects have already been handled are only kept for the current run: garbage
+    # can turn up again where something was handled on an earlier run.
+    def __init__(self, width_cm, height_cm, cell_size=CELL_SIZE, margin=MAP_MARGIN, log_odds=None):
+        self.width_cm = width_cm
+        self.height_cm = height_cm
+        self.cell_size = cell_size
+        self.margin = margin
+        self.rows = int(np.ceil((height_cm + 2 * margin) / cell_size))
+        self.cols = int(np.ceil((width_cm + 2 * margin) / cell_size))
+
+        if log_odds is None:
+            log_odds = np.zeros((self.rows, self.cols), dtype=np.float32)
+        self.log_odds = log_odds
+        self.visited = np.zeros((self.rows, self.cols), dtype=np.float32)
+
+    def metadata(self):
+        return {'width_cm': self.width_cm, 'height_cm': self.height_cm,
+                'cell_size': self.cell_size, 'margin': self.margin}
+
+    def world_to_cell(self, x, y):
+        col = np.floor((np.asarray(x) + self.margin) / self.cell_size).astype(np.intp)
+        row = np.floor((np.asarray(y) + self.margin) / self.cell_size).astype(np.intp)
+        return row, col
+
+    def in_bounds(self, row, col):
+        return (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+
+    def integrate_scan(self, angles, distances, pose):
+        # Ray update for one LiDAR revolution. angles are LiDAR degrees (270 straight ahead,
+        # growing clockwise), distances in mm, pose is (x cm, y cm, heading deg clockwise).
+        # Cells along each beam become freer, the cells at the returns more occupied.
+        if len(angles) == 0:
+            return
+        x, y, heading = pose
+        bearings = np.radians(heading + np.asarray(angles) - 270)
+        ranges = np.asarray(distances) / 10
+        sin_b = np.sin(bearings)
+        cos_b = np.cos(bearings)
+
+        # Free space: sample every half cell along each beam, stopping one cell short of the return
+        step = self.cell_size / 2
+        samples = np.arange(0, ranges.max(), step)
+        along = samples[np.newaxis, :]
+        inside = along < (ranges[:, np.newaxis] - self.cell_size)
+        free_x = (x + along * sin_b[:, np.newaxis])[inside]
+        free_y = (y + along * cos_b[:, np.newaxis])[inside]
+        self._add(free_x, free_y, LOG_ODDS_FREE)
+
+        self._add(x + ranges * sin_b, y + ranges * cos_b, LOG_ODDS_OCCUPIED)
+
+    def _add(self, x, y, amount):
+        # Each cell is updated at most once per call however many samples fall in it
+        row, col = self.world_to_cell(x, y)
+        keep = self.in_bounds(row, col)
+        cells = np.unique(row[keep] * self.cols + col[keep])
+        flat = self.log_odds.reshape(-1)
+        flat[cells] = np.clip(flat[cells] + amount, LOG_ODDS_MIN, LOG_ODDS_MAX)
+
+    def _lookup(self, layer, x, y, default):
+        row, col = self.world_to_cell(x, y)
+        if not self.in_bounds(row, col):
+            return default
+        return layer[row, col]
+
+    def is_occupied(self, x, y):
+        return bool(self._lookup(self.log_odds, x, y, 0.0) >= OCCUPIED_THRESHOLD)
+
+    def is_free(self, x, y):
+        return bool(self._lookup(self.log_odds, x, y, 0.0) <= FREE_THRESHOLD)
+
+    def is_known(self, x, y):
+        return self.is_occupied(x, y) or self.is_free(x, y)
+
+    def mark_visited(self, x, y, radius_cm=0):
+        row, col = self.world_to_cell(x, y)
+        reach = int(np.ceil(radius_cm / self.cell_size))
+        rows = slice(max(row - reach, 0), max(min(row + reach + 1, self.rows), 0))
+        cols = slice(max(col - reach, 0), max(min(col + reach + 1, self.cols), 0))
+        self.visited[rows, cols] = 1
+
+    def is_visited(self, x, y):
+        return bool(self._lookup(self.visited, x, y, 0.0) > 0)
+
+    def flush(self):
+        if isinstance(self.log_odds, np.memmap):
+            self.log_odds.flush()
+
+    def save(self, path):
+        log_odds = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=self.log_odds.shape)
+        log_odds[:] = self.log_odds
+        log_odds.flush()
+        with open(path + ".json", "w") as file:
+            json.dump(self.metadata(), file)
+
+def load_map(path, mmap_mode="r+"):
+    # Load a saved map. With a memory map, updates go straight to the file.
+    with open(path + ".json", "r") as file:
+        metadata = json.load(file)
+    log_odds = np.load(path, mmap_mode=mmap_mode)
+    if log_odds.ndim == 3:
+        log_odds = log_odds[0]  # Maps saved with the visited layer, which is no longer kept
+    return OccupancyGrid(metadata['width_cm'], metadata['height_cm'], metadata['cell_size'], metadata['margin'], log_odds)
+
+def open_map(path, width_cm, height_cm, cell_size=CELL_SIZE, margin=MAP_MARGIN):
+    # Open the map at path, or create a new memory-mapped one if it does not exist or does not
+    # match the perimeter
+    if os.path.exists(path) and os.path.exists(path + ".json"):
+        occupancy_map = load_map(path)
+        if occupancy_map.metadata() == {'width_cm': width_cm, 'height_cm': height_cm,
+                                        'cell_size': cell_size, 'margin': margin}:
+            return occupancy_map
+        print("Saved map does not match the perimeter. Starting a new map.")
+
+    occupancy_map = OccupancyGrid(width_cm, height_cm, cell_size, margin)
+    occupancy_map.save(path)
+    return load_map(path)
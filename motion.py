@@ -1,72 +1,193 @@
 import time
+import threading
 import navigation
 import gpio
 from navigation import set_direction
+from arbiter import MotionCommand, submit_motion, CORRECTION, MANOEUVRE
 
-def move_forward_until(distance_cm, mode, direction=None):
-    set_direction(1)
-    if mode == "path":
-        navigation.start_path_distance(direction)
-    elif mode == "object":
-        navigation.start_garbage_distance()
-    
-    gpio.move_forward()
-    
-    while True:
-        if mode == "path":
-            distance = navigation.update_path_distance(direction)
-        elif mode == "object":
-            distance = navigation.update_garbage_distance()
-            
-        if distance >= distance_cm:
-            gpio.stop_moving()
-            break
-        
-        time.sleep(0.1)
-
-def move_backward_until(distance_cm, mode, direction=None):
-    set_direction(-1)
-    if mode == "path":
-        navigation.start_path_distance(direction)
-    elif mode == "object":
-        navigation.start_garbage_distance()
-    
-    gpio.move_backward()
-    
-    while True:
-        if mode == "path":
-            distance = navigation.update_path_distance(direction)
-        elif mode == "object":
-            distance = navigation.update_garbage_distance()
-            
-        if distance <= -distance_cm: # distance_cm is passed as a positive value even if moving backward
+# Every motion below runs as a command in the motion arbiter thread, so only one manoeuvre drives the
+# motor pins at a time. The public functions submit their command and wait for it to finish. The
+# running command's stop can also come from the encoder thread (a straight move reaching its target)
+# or the IMU sampler thread (a turn's predictive stop); a command removes its stop callback before it
+# returns, so a late stop can never hit the next command.
+
+# Straight moves register their target with the encoder odometry, and the tick that reaches it stops
+# the motors. on_slow_zone, if set, is called SLOW_ZONE_CM before the target (gpio has no speed
+# control yet, so nothing slows down by default).
+SLOW_ZONE_CM = 5
+on_slow_zone = None
+# A move that has not covered its distance after MOVE_START_TIME plus the distance at MIN_MOVE_SPEED has
+# failed (stalled wheels, or no encoder ticks), and is stopped rather than left driving
+MIN_MOVE_SPEED = 5.0   # cm/s
+MOVE_START_TIME = 1.0  # s
+
+class StraightMove:
+    # Run of a pre-emptible move command. A pre-empted move stops where it is and keeps the distance
+    # still to go for when the arbiter resumes it. Running out of time stops the motors and raises
+    # RuntimeError.
+    def __init__(self, distance_cm, start_motors):
+        self.remaining_cm = distance_cm  # Negative when reversing
+        self.start_motors = start_motors
+
+    def __call__(self, command):
+        if self.remaining_cm == 0:
+            return
+        def on_reached():
             gpio.stop_moving()
-            break
-        
-        time.sleep(0.1)
+            command.interrupt.set()
+
+        set_direction(1 if self.remaining_cm > 0 else -1)
+        target = navigation.add_distance_target(self.remaining_cm, on_reached, SLOW_ZONE_CM, on_slow_zone)
+        self.start_motors()
+        # Target reached or pre-empted, each run gets the time for the distance it has left
+        finished = command.interrupt.wait(MOVE_START_TIME + abs(self.remaining_cm) / MIN_MOVE_SPEED)
+        # After this no tick can stop the motors or set the interrupt the arbiter clears for the resume
+        navigation.remove_distance_target(target)
+        if target.reached.is_set():
+            self.remaining_cm = 0
+            return
+        gpio.stop_moving()
+        left = abs(self.remaining_cm) - target.progress(navigation.read_odometry().distance)
+        if not finished:
+            raise RuntimeError(f"Move of {self.remaining_cm:.1f} cm timed out with {max(left, 0):.1f} cm to go")
+        self.remaining_cm = max(left, 0) * target.direction
+
+def move_until(distance_cm, start_motors):
+    # distance_cm is negative when reversing
+    move = StraightMove(distance_cm, start_motors)
+    submit_motion(MotionCommand("move", move, MANOEUVRE, preemptible=True)).result()
+
+def move_forward_until(distance_cm):
+    # The distance is measured along the path length from the start of the move, so the path
+    # distances main tracks carry on
+    move_until(max(distance_cm, 0), gpio.move_forward)
+
+def move_backward_until(distance_cm):
+    # distance_cm is passed as a positive value even if moving backward
+    move_until(-max(distance_cm, 0), gpio.move_backward)
+
+## Predictive turn stop ##
+# Turns are stopped early by the IMU sampler thread, when the angle turned plus the current rate
+# times the stop lag (how long the robot keeps rotating after stop_turning) reaches the target.
+# The lag is learned from how far each turn coasts after the stop.
+INITIAL_STOP_LAG = 0.1    # s
+STOP_LAG_SMOOTHING = 0.3  # Weight of the latest turn in the lag estimate
+MAX_STOP_LAG = 0.5        # s
+MIN_LEARNING_RATE = 10.0  # Turns stopped slower than this (degrees/s) say little about the lag
+SETTLE_RATE = 1.0         # degrees/s, below which the robot has stopped turning
+SETTLE_TIMEOUT = 1.0      # s
+# A turn that has not reached its target after TURN_START_TIME plus the angle at MIN_TURN_RATE has
+# failed (stalled wheels, or no IMU samples), and is stopped rather than left spinning
+MIN_TURN_RATE = 20.0      # degrees/s
+TURN_START_TIME = 1.0     # s
+
+class TurnController:
+    def __init__(self, read_imu, stop_lag=INITIAL_STOP_LAG, smoothing=STOP_LAG_SMOOTHING):
+        self.read_imu = read_imu
+        self.stop_lag = stop_lag
+        self.smoothing = smoothing
+        self.active_turn = None
+        self.turn_lock = threading.Lock()  # Held while a sample checks the turn, so ending it waits for a stop in progress
+        self.turns = 0
+        self.last_error = None  # Final angle minus target of the last turn, positive for overshoot
+
+    def on_sample(self, imu):
+        # Runs in the IMU sampler thread on every sample
+        with self.turn_lock:
+            turn = self.active_turn
+            if turn is None or turn['stopped'].is_set():
+                return
+            angle = imu.heading - turn['start_heading']
+            predicted = (angle + imu.rate * self.stop_lag) * turn['direction']
+            if predicted >= turn['target']:
+                turn['stop_motors']()
+                turn['stop_angle'] = angle
+                turn['stop_rate'] = imu.rate
+                turn['stopped'].set()
+
+    def turn(self, angle_deg, direction, start_motors, stop_motors, interrupt=None):
+        # Turn angle_deg (positive) to the right (direction 1) or left (-1). Returns the angle turned
+        # once the robot has settled, clockwise positive. Setting the interrupt event, or running out
+        # of time, stops the motors and raises RuntimeError.
+        if angle_deg <= 0:
+            return 0.0
+        stopped = interrupt if interrupt is not None else threading.Event()
+        turn = {
+            'target': angle_deg, 'direction': direction, 'start_heading': self.read_imu().heading,
+            'stop_motors': stop_motors, 'stopped': stopped, 'stop_angle': None, 'stop_rate': 0.0
+        }
+        self.active_turn = turn
+        start_motors()
+        finished = stopped.wait(TURN_START_TIME + angle_deg / MIN_TURN_RATE)
+        with self.turn_lock:
+            self.active_turn = None
+        if turn['stop_angle'] is None:
+            stop_motors()
+            reason = "interrupted" if finished else "timed out"
+            raise RuntimeError(f"Turn of {angle_deg:.1f} degrees {reason}")
+
+        # Let the robot coast to a stop before measuring the turn
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        imu = self.read_imu()
+        while abs(imu.rate) > SETTLE_RATE and time.monotonic() < deadline:
+            time.sleep(0.01)
+            imu = self.read_imu()
+        final_angle = imu.heading - turn['start_heading']
+        self._learn(turn, final_angle)
+        return final_angle
+
+    def _learn(self, turn, final_angle):
+        self.turns += 1
+        self.last_error = (final_angle * turn['direction']) - turn['target']
+        stop_rate = abs(turn['stop_rate'])
+        if stop_rate < MIN_LEARNING_RATE:
+            return
+        # Rotation after the stop command divided by the rate at the stop is the lag this turn had
+        coast = (final_angle - turn['stop_angle']) * turn['direction']
+        measured_lag = min(max(coast / stop_rate, 0.0), MAX_STOP_LAG)
+        self.stop_lag += self.smoothing * (measured_lag - self.stop_lag)
+
+turn_controller = None
+
+def get_turn_controller():
+    global turn_controller
+    if turn_controller is None:
+        turn_controller = TurnController(navigation.read_imu)
+        navigation.init_imu().add_sample_callback(turn_controller.on_sample)
+    return turn_controller
+
+def turn_until(angle_deg, direction, priority=MANOEUVRE, shift_path=True):
+    # Turns are never pre-empted, a correction submitted meanwhile waits for the turn to end.
+    # shift_path turns the path direction along with the robot; a correction turn leaves it in place,
+    # so any error left after the correction still shows up as deviation.
+    def run(command):
+        navigation.start_angle()
+        # Spinning in place is not travel: without this, single-channel encoders would count the wheel
+        # arcs as driving forward and the pose would drift along the turning heading
+        set_direction(0)
+        start_motors = gpio.turn_right if direction == 1 else gpio.turn_left
+        try:
+            get_turn_controller().turn(angle_deg, direction, start_motors, gpio.stop_turning, command.interrupt)
+        except RuntimeError:
+            navigation.reset_angle(None if shift_path else 0.0)  # Whatever was turned is not deviation
+            raise
+        navigation.reset_angle(angle_deg * direction if shift_path else 0.0)
+    submit_motion(MotionCommand("turn", run, priority)).result()
 
 def turn_right_until(angle_deg):
-    navigation.start_angle()
-    
-    gpio.turn_right()
-    
-    while True:
-        angle = navigation.update_angle()
-        if angle >= angle_deg:
-            gpio.stop_turning()
-            break
-        
-        time.sleep(0.1)
+    turn_until(angle_deg, 1)
 
 def turn_left_until(angle_deg):
-    navigation.start_angle()
-    
-    gpio.turn_left()
-    
-    while True:
-        angle = navigation.update_angle()
-        if angle <= -angle_deg: # angle_deg is passed as a positive value even if turning left
-            gpio.stop_turning()
-            break
-        
-        time.sleep(0.1)
\ No newline at end of file
+    # angle_deg is passed as a positive value even if turning left
+    turn_until(angle_deg, -1)
+
+def correct_deviation(deviation_deg):
+    # Turn back onto the path direction, ahead of the sweep's queued manoeuvres and pre-empting a
+    # straight move, which then carries on with the distance it had left
+    if deviation_deg > 0:
+        turn_until(deviation_deg, -1, CORRECTION, shift_path=False)
+    else:
+        turn_until(-deviation_deg, 1, CORRECTION, shift_path=False)
+
+def collect_garbage():
+    submit_motion(MotionCommand("collect", lambda command: gpio.collect_garbage())).result()
@@ -1,236 +1,168 @@
 # Import libraries
-import time
 from math import pi
-from gpiozero import Button
 from smbus2 import SMBus
+from odometry import OdometryEngine
+from imu import BNO055, ImuSampler, IMU_RATE_HZ, normalize_angle
+from pose import PoseEstimator
 
 ## Rotary wheel encoder setup ##
 
 # Declare GPIO pins and channels
 left_A = 5  # Left encoder, channel A, GPIO pin 5 (corresponds to pin 7)
 right_A = 6
+left_B = None  # Channel B pins, None while not wired (enables quadrature decoding when set)
+right_B = None
 
 # Encoder parameters
 ppr = 12
 decoding_factor = 2  # Pulse on rising and falling edges for 2x decoding
 eff_cpr = ppr * decoding_factor
 r = 3.65  # Radius
-cm_per_pulse = 2 * pi * r / eff_cpr
-
-# State
-left_count = 0  # Directional net count
-right_count = 0
-left_distance = 0.0  # Total distance regardless of direction
-right_distance = 0.0
-start_time_encoder = time.time()
+cm_per_pulse = 2 * pi * r / eff_cpr  # Distance per odometry count
 
 # Motion direction
 current_direction = 1
 def set_direction(direction):
     global current_direction
     current_direction = direction
+    if odometry is not None:
+        odometry.set_direction(direction)
 
 # Noise rejection
 min_pulse_interval = 0.001  # Max pulse frequency @ 1000 Hz
-last_left_time = 0
-last_right_time = 0
-
-# Interrupt handlers for Channel A
-def on_left_A():
-    global left_count, last_left_time
-    now = time.time()
-    if now - last_left_time >= min_pulse_interval:
-        left_count += 2*current_direction
-        last_left_time = now
-
-def on_right_A():
-    global right_count, last_right_time
-    now = time.time()
-    if now - last_right_time >= min_pulse_interval:
-        right_count += 2*current_direction
-        last_right_time = now
-
-# Set up channel A with rising (released) and falling (pressed) edges
-left_button = Button(left_A, pull_up=False)
-right_button = Button(right_A, pull_up=False)
-left_button.when_pressed = on_left_A
-left_button.when_released = on_left_A
-right_button.when_pressed = on_right_A
-right_button.when_released = on_right_A
-
-## BNO055 IMU setup ##
 
-BNO055_ADDRESS = 0x28
-BNO055_CHIP_ID_ADDR = 0x00
-BNO055_OPR_MODE_ADDR = 0x3D
-BNO055_PWR_MODE_ADDR = 0x3E
-BNO055_UNIT_SEL_ADDR = 0x3B
+# Encoder odometry, started by init_encoders
+odometry = None
 
-CONFIGMODE = 0X00
-NDOF_MODE = 0X0C
+def init_encoders(pin_factory=None):
+    global odometry
+    if odometry is None:
+        odometry = OdometryEngine((left_A, left_B), (right_A, right_B), cm_per_pulse, pin_factory, min_pulse_interval)
+        odometry.set_direction(current_direction)
+    return odometry
 
-GYRO_DATA_ADDR = 0x14
+def read_odometry():
+    # Latest consistent encoder snapshot: counts, distance (cm) and velocity (cm/s)
+    return init_encoders().snapshot()
 
-bus = SMBus(10) # I2C bus 10 since bus 1 doesn't work - GPIO pin 17 (SDA) and GPIO pin 27 (SCL)
+def add_distance_target(distance_cm, on_reached=None, slow_zone_cm=0.0, on_slow=None):
+    # Fire on_reached from the encoder tick that covers distance_cm (negative when reversing)
+    return init_encoders().add_distance_target(distance_cm, on_reached, slow_zone_cm, on_slow)
 
-# Read gyroscope data
-def read_gyro_z():
-    data = bus.read_i2c_block_data(BNO055_ADDRESS, GYRO_DATA_ADDR, 6)
-    z = int.from_bytes(data[4:6], byteorder='little', signed=True)
-    return z / 16.0  # degrees/s
+def remove_distance_target(target):
+    # No callback of the target runs after this returns
+    init_encoders().remove_target(target)
 
-# State (z axis only for 2D angle tracking)
-filtered_gyro = 0.0  # Filtered angular velocity
+## BNO055 IMU setup ##
 
-# Filtering
-alpha = 0.1  # Low pass filter
-gyro_deadzone = 0.2  # Rudimentary high pass filter
+IMU_BUS = 10  # I2C bus 10 since bus 1 doesn't work - GPIO pin 17 (SDA) and GPIO pin 27 (SCL)
+bus = None  # Opened by init_imu
+imu_device = None
+imu_sampler = None
+
+def init_imu(bus_number=IMU_BUS, rate_hz=IMU_RATE_HZ, i2c_bus=None):
+    # Open the bus, put the BNO055 into fusion mode and start sampling it in the background.
+    # i2c_bus replaces the SMBus, e.g. with imu.Bno055Emulator.
+    global bus, imu_device, imu_sampler
+    if bus is None:
+        bus = i2c_bus if i2c_bus is not None else SMBus(bus_number)
+    if imu_device is None:
+        imu_device = BNO055(bus)
+        imu_device.begin()
+    if imu_sampler is None:
+        imu_sampler = ImuSampler(imu_device.read_sample, rate_hz)
+    imu_sampler.start()
+    return imu_sampler
+
+def stop_imu():
+    global imu_sampler
+    if imu_sampler is not None:
+        imu_sampler.stop()
+        imu_sampler = None
+
+def read_imu():
+    # Latest heading and filtered rate from the IMU sampler
+    return (imu_sampler if imu_sampler is not None else init_imu()).snapshot()
+
+def init_navigation(pin_factory=None):
+    # Claim the encoder pins, start sampling the IMU and tracking the pose. Nothing is touched at import time.
+    init_encoders(pin_factory)
+    init_imu()
+    init_pose()
+
+## Pose tracking ##
+# The pose estimator is updated by the IMU sampler thread on every sample with the latest encoder
+# distance. Everything below reads its snapshot rather than keeping its own running totals.
+pose_estimator = None
+
+def init_pose():
+    global pose_estimator
+    if pose_estimator is None:
+        odometry_engine = init_encoders()
+        pose_estimator = PoseEstimator()
+        init_imu().add_sample_callback(
+            lambda imu: pose_estimator.update(odometry_engine.snapshot().distance, imu.heading, imu.timestamp)
+        )
+    return pose_estimator
+
+def read_pose():
+    # Latest (timestamp, x, y, heading, distance) snapshot
+    return (pose_estimator if pose_estimator is not None else init_pose()).snapshot()
+
+def pose_at(timestamp):
+    # Pose at a past time.monotonic() timestamp, e.g. the middle of a LiDAR revolution
+    return init_pose().pose_at(timestamp)
+
+def get_heading():
+    # Heading in degrees, 0 along the starting direction and growing clockwise like the turn angle
+    return normalize_angle(read_pose().heading)
+
+def get_pose():
+    pose = read_pose()
+    return pose.x, pose.y, normalize_angle(pose.heading)
 
 ## Navigation variables
-path_distance_x = 0.0       # Distance travelled on preset path (use to stay within perimeter)
-path_distance_y = 0.0       
-garbage_distance = 0        # Distance travelled when collecting garbage (use to travel to and from detected objects)
-angle = 0.0                 # Adjusted angle when turning
-
-# Garbage distance tracking
-garbage_distance_flag = False
-prev_left_garbage = 0
-prev_right_garbage = 0
-
-def start_garbage_distance():
-    global garbage_distance_flag, prev_left_garbage, prev_right_garbage
-    garbage_distance_flag = True
-    prev_left_garbage = left_count
-    prev_right_garbage = right_count
-    
-def update_garbage_distance(): # Update garbage distance with new pulses
-    global garbage_distance, prev_left_garbage, prev_right_garbage
-    
-    if garbage_distance_flag:
-        delta_left_count = left_count - prev_left_garbage
-        delta_right_count = right_count - prev_right_garbage
-        delta_avg_count = (delta_left_count + delta_right_count) / 2
-        garbage_distance += delta_avg_count * cm_per_pulse
-        prev_left_garbage = left_count
-        prev_right_garbage = right_count
-        
-    return garbage_distance
-        
-def reset_garbage_distance():
-    global garbage_distance_flag, garbage_distance
-    garbage_distance_flag = False
-    garbage_distance = 0.0
+# Distances and angles are measured from marks taken when tracking starts
+path_marks = {}                 # "x" or "y" -> pose position along that axis (use to stay within perimeter)
+heading_marks = {"path": 0.0}   # "path" -> heading of the path, "turn" -> heading when the current turn started
 
 # Path distance tracking
-path_distance_flag = False
-path_distance_y = 0.0
-path_distance_y_initial = 0.0
-path_distance_x = 0.0
-path_distance_x_initial = 0.0
+def axis_position(pose, direction):
+    return pose.x if direction == "x" else pose.y
 
 def start_path_distance(direction):
-    global path_distance_flag, path_distance_x_initial, path_distance_y_initial
-    path_distance_flag = True
-    if direction == "x":
-        path_distance_x_initial = (left_count + right_count) * cm_per_pulse / 2
-    elif direction == "y":
-        path_distance_y_initial = (left_count + right_count) * cm_per_pulse / 2
+    path_marks[direction] = axis_position(read_pose(), direction)
     
 def update_path_distance(direction):
-    global path_distance_x, path_distance_y
-    
-    if direction == "x":
-        if garbage_distance_flag:
-            return path_distance_x
-        if path_distance_flag:
-            path_distance_x_new = (left_count + right_count) * cm_per_pulse / 2
-            path_distance_x = path_distance_x_new - path_distance_x_initial
-        return path_distance_x
-        
-    elif direction == "y":
-        if garbage_distance_flag:
-            return path_distance_y
-        if path_distance_flag:
-            path_distance_y_new = (left_count + right_count) * cm_per_pulse / 2
-            path_distance_y = path_distance_y_new - path_distance_y_initial
-        return path_distance_y
+    # Distance covered along the x or y axis since start_path_distance. Driving out to an object and
+    # back again leaves it unchanged.
+    if direction not in path_marks:
+        return 0.0
+    return abs(axis_position(read_pose(), direction) - path_marks[direction])
 
 def reset_path_distance(direction):
-    global path_distance_flag, path_distance_x, path_distance_y
-    path_distance_flag = False
-    
-    if direction == "x":
-        path_distance_x = 0.0
-    elif direction == "y":
-        path_distance_y = 0.0
+    path_marks.pop(direction, None)
 
 # Turn angle tracking for perimeter turns and garbage collection
-angle_flag = False
-prev_angle_time = 0.0
-angle = 0.0
-
 def start_angle():
-    global angle_flag, prev_angle_time
-    angle_flag = True
-    prev_angle_time = time.time()
+    heading_marks["turn"] = read_pose().heading
     
-def update_angle():
-    global angle, filtered_gyro, prev_angle_time
-            
-    if angle_flag:
-        # IMU calculations
-        current_time_imu = time.time()
-        dt = current_time_imu - prev_angle_time
-        prev_angle_time = current_time_imu
-         
-        raw_gyro = read_gyro_z()
-
-        # Low pass filter
-        filtered_gyro = alpha * raw_gyro + (1 - alpha) * filtered_gyro
-        # Rudimentary high pass filter
-        if abs(filtered_gyro) < gyro_deadzone:                          
-            filtered_gyro = 0
-
-        # Integrate angular velocity to calculate angle
-        angle += filtered_gyro * dt
-        # Normalize angle from 0 to 180 degrees
-        angle = (angle + 180) % 360 - 180
-            
-    return angle
-        
-def reset_angle():
-    global angle_flag, angle
-    angle_flag = False
-    angle = 0.0
+def reset_angle(commanded_deg=None):
+    # End of a turn: the commanded rotation (clockwise positive) is not deviation from the path, but
+    # any over- or undershoot is. Without a commanded angle the whole measured rotation is excluded.
+    turn_start = heading_marks.pop("turn", None)
+    if turn_start is not None:
+        heading_marks["path"] += read_pose().heading - turn_start if commanded_deg is None else commanded_deg
 
 # Path angle tracking for deviation correction
-prev_deviation_angle_time = 0.0
-deviation_angle = 0.0
-
 def start_deviation_angle():
-    global prev_deviation_angle_time
-    prev_deviation_angle_time = time.time()
+    # Take the current heading as the path direction
+    heading_marks["path"] = read_pose().heading
 
 def update_deviation_angle():
-    global deviation_angle, filtered_gyro, prev_deviation_angle_time
-    
-    if not angle_flag:
-        # IMU calculations
-        current_time_imu = time.time()
-        dt = current_time_imu - prev_deviation_angle_time
-        prev_deviation_angle_time = current_time_imu
-         
-        raw_gyro = read_gyro_z()
-
-        # Low pass filter
-        filtered_gyro = alpha * raw_gyro + (1 - alpha) * filtered_gyro
-        # Rudimentary high pass filter
-        if abs(filtered_gyro) < gyro_deadzone:                          
-            filtered_gyro = 0
-
-        # Integrate angular velocity to calculate deviation angle
-        deviation_angle += filtered_gyro * dt
-        # Normalize deviation angle from 0 to 180 degrees
-        deviation_angle = (deviation_angle + 180) % 360 - 180
-            
-    return deviation_angle
\ No newline at end of file
+    # Drift from the path direction, normalized from -180 to 180 degrees. Held at its value from
+    # the start of a turn until the turn ends.
+    heading = heading_marks.get("turn")
+    if heading is None:
+        heading = read_pose().heading
+    return normalize_angle(heading - heading_marks["path"])
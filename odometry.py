@@ -0,0 +1,240 @@
+# Import libraries
+import time
+import threading
+from collections import namedtuple
+import numpy as np
+from gpiozero import Button
+
+## Wheel encoder odometry engine ##
+# Counts are in quadrature units (four per encoder cycle). With only channel A wired, each edge of A
+# is half a cycle and counts 2 in the commanded direction, as before. With channel B wired as well,
+# every edge of either channel is decoded against the previous A/B state and counts 1 with the
+# direction given by the phase, so reversing and turning are tracked correctly.
+MIN_TICK_INTERVAL = 0.001  # Debounce for channel A only decoding, max pulse frequency @ 1000 Hz
+TICK_HISTORY = 256         # Tick timestamps kept per wheel
+VELOCITY_TICKS = 4         # Ticks spanned by the velocity estimate
+STALL_TIMEOUT = 0.25       # Velocity reads 0 after this long without a tick (s)
+
+# Count change for (previous A/B state << 2 | new A/B state). A leading B (A rising while B is low,
+# as in testing/sensors_test.py) counts forward. Both channels changing at once means a missed edge
+# and counts nothing.
+QUADRATURE_STEPS = (
+    0, -1, 1, 0,
+    1, 0, 0, -1,
+    -1, 0, 0, 1,
+    0, 1, -1, 0
+)
+
+WheelState = namedtuple("WheelState", "count travelled velocity tick_time")
+OdometrySnapshot = namedtuple(
+    "OdometrySnapshot",
+    "timestamp left_count right_count distance travelled left_velocity right_velocity velocity"
+)
+
+class WheelEncoder:
+    # Decodes one wheel from its GPIO callbacks. Only the callback thread writes; the latest state is
+    # published as an immutable WheelState so readers never see a half-updated count.
+    def __init__(self, pin_a, pin_b=None, pin_factory=None, min_interval=MIN_TICK_INTERVAL,
+                 history_size=TICK_HISTORY, on_tick=None):
+        self.min_interval = min_interval
+        self.on_tick = on_tick
+        self.direction = 1  # Commanded direction, used when channel B is not wired
+        self.count = 0
+        self.travelled = 0  # Counts regardless of direction
+        self.missed = 0     # Quadrature transitions where both channels changed
+        self.last_edge_time = -np.inf
+
+        # Preallocated ring of tick timestamps and the count after each tick
+        self.tick_times = np.zeros(history_size)
+        self.tick_counts = np.zeros(history_size, dtype=np.int64)
+        self.ticks = 0
+        self.state = WheelState(0, 0, 0.0, None)
+
+        # Inputs with rising (released) and falling (pressed) edges, no internal pull-ups as the
+        # encoder has an external circuit
+        self.channel_a = Button(pin_a, pull_up=False, pin_factory=pin_factory)
+        self.channel_b = Button(pin_b, pull_up=False, pin_factory=pin_factory) if pin_b is not None else None
+        if self.channel_b is None:
+            self.channel_a.when_pressed = self._on_edge
+            self.channel_a.when_released = self._on_edge
+        else:
+            self.phase = self._read_phase()
+            for channel in (self.channel_a, self.channel_b):
+                channel.when_pressed = self._on_quadrature_edge
+                channel.when_released = self._on_quadrature_edge
+
+    def is_quadrature(self):
+        return self.channel_b is not None
+
+    def _read_phase(self):
+        return self.channel_a.is_pressed << 1 | self.channel_b.is_pressed
+
+    def _on_edge(self):
+        now = time.monotonic()
+        if now - self.last_edge_time >= self.min_interval:
+            self.last_edge_time = now
+            self._tick(2 * self.direction, now)
+
+    def _on_quadrature_edge(self):
+        # Bounces cancel out: a channel flipping and back counts +1 then -1, so no debounce is needed
+        now = time.monotonic()
+        phase = self._read_phase()
+        step = QUADRATURE_STEPS[self.phase << 2 | phase]
+        if phase != self.phase and step == 0:
+            self.missed += 1
+        self.phase = phase
+        if step:
+            self._tick(step, now)
+
+    def _tick(self, step, now):
+        self.count += step
+        self.travelled += abs(step)
+
+        history_size = len(self.tick_times)
+        i = self.ticks % history_size
+        self.tick_times[i] = now
+        self.tick_counts[i] = self.count
+        self.ticks += 1
+
+        # Counts per second over the last few ticks
+        span = min(VELOCITY_TICKS, self.ticks - 1)
+        velocity = 0.0
+        if span > 0:
+            j = (self.ticks - 1 - span) % history_size
+            dt = now - self.tick_times[j]
+            if dt > 0:
+                velocity = float(self.count - self.tick_counts[j]) / float(dt)
+
+        self.state = WheelState(self.count, self.travelled, velocity, now)
+        if self.on_tick is not None:
+            self.on_tick()
+
+    def tick_history(self):
+        # Copies of the retained (timestamps, counts), oldest first. Taken without a lock, so a tick
+        # arriving during the copy may overwrite the oldest entry.
+        ticks = self.ticks
+        history_size = len(self.tick_times)
+        order = (np.arange(max(ticks - history_size, 0), ticks)) % history_size
+        return self.tick_times[order], self.tick_counts[order]
+
+    def close(self):
+        self.channel_a.close()
+        if self.channel_b is not None:
+            self.channel_b.close()
+
+def wheel_velocity(state, now):
+    # A wheel that has not ticked recently has stopped, whatever its last estimate was
+    if state.tick_time is None or now - state.tick_time > STALL_TIMEOUT:
+        return 0.0
+    return state.velocity
+
+class DistanceTarget:
+    # A distance (cm, negative when reversing) from where the target was registered. The tick that
+    # reaches it calls on_reached and sets the event from the encoder callback thread, so the stop
+    # happens within one tick. on_slow is called once on entering the slow zone before the target.
+    def __init__(self, start, distance_cm, on_reached=None, slow_zone_cm=0.0, on_slow=None):
+        self.start = start
+        self.distance_cm = distance_cm
+        self.direction = 1 if distance_cm >= 0 else -1
+        self.on_reached = on_reached
+        self.slow_zone_cm = slow_zone_cm
+        self.on_slow = on_slow
+        self.slowed = False
+        self.reached = threading.Event()
+        self.reached_distance = None
+        self.cancelled = False
+
+    def progress(self, distance):
+        # Distance covered towards the target, positive in the target's direction
+        return (distance - self.start) * self.direction
+
+    def check(self, distance):
+        # Returns True once the target is done with, reached or cancelled
+        if self.cancelled:
+            return True
+        progress = self.progress(distance)
+        if progress >= abs(self.distance_cm):
+            self.reached_distance = distance
+            if self.on_reached is not None:
+                self.on_reached()
+            self.reached.set()
+            return True
+        if not self.slowed and self.on_slow is not None and progress >= abs(self.distance_cm) - self.slow_zone_cm:
+            self.slowed = True
+            self.on_slow()
+        return False
+
+    def wait(self, timeout=None):
+        return self.reached.wait(timeout)
+
+    def cancel(self):
+        self.cancelled = True
+
+class OdometryEngine:
+    # Both wheels combined into one OdometrySnapshot, republished on every tick, which also checks the
+    # registered distance targets. Readers take the current snapshot with a single attribute read;
+    # only the callback threads and target registration share a lock.
+    def __init__(self, left_pins, right_pins, cm_per_count, pin_factory=None, min_interval=MIN_TICK_INTERVAL,
+                 history_size=TICK_HISTORY):
+        self.cm_per_count = cm_per_count
+        self.publish_lock = threading.Lock()
+        self.latest = OdometrySnapshot(time.monotonic(), 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.targets = ()  # Replaced, never mutated, so the tick thread iterates without a lock
+        self.left = WheelEncoder(*left_pins, pin_factory=pin_factory, min_interval=min_interval,
+                                 history_size=history_size, on_tick=self._publish)
+        self.right = WheelEncoder(*right_pins, pin_factory=pin_factory, min_interval=min_interval,
+                                  history_size=history_size, on_tick=self._publish)
+
+    def set_direction(self, direction):
+        # Commanded direction (1 forward, -1 backward, 0 turning in place) for wheels without channel B.
+        # While turning in place the ticks are ignored, as the wheels do not move the robot along its path.
+        self.left.direction = direction
+        self.right.direction = direction
+
+    def _publish(self):
+        with self.publish_lock:
+            left, right = self.left.state, self.right.state
+            timestamp = max(t for t in (left.tick_time, right.tick_time) if t is not None)
+            left_velocity = wheel_velocity(left, timestamp) * self.cm_per_count
+            right_velocity = wheel_velocity(right, timestamp) * self.cm_per_count
+            self.latest = OdometrySnapshot(
+                timestamp,
+                left.count,
+                right.count,
+                (left.count + right.count) / 2 * self.cm_per_count,
+                (left.travelled + right.travelled) / 2 * self.cm_per_count,
+                left_velocity,
+                right_velocity,
+                (left_velocity + right_velocity) / 2
+            )
+            if self.targets:
+                done = [target for target in self.targets if target.check(self.latest.distance)]
+                if done:
+                    self.targets = tuple(target for target in self.targets if target not in done)
+
+    def add_distance_target(self, distance_cm, on_reached=None, slow_zone_cm=0.0, on_slow=None):
+        # Register a target distance from the current position. Returns the DistanceTarget to wait on.
+        with self.publish_lock:
+            target = DistanceTarget(self.latest.distance, distance_cm, on_reached, slow_zone_cm, on_slow)
+            if not target.check(self.latest.distance):
+                self.targets = self.targets + (target,)
+        return target
+
+    def remove_target(self, target):
+        # Cancel a target. Targets are checked under the same lock, so once this returns its
+        # on_reached has either already run or never will.
+        with self.publish_lock:
+            target.cancel()
+            self.targets = tuple(t for t in self.targets if t is not target)
+
+    def snapshot(self):
+        # Latest counts, distance (cm) and velocity (cm/s). Velocity reads 0 once the wheels have
+        # stopped ticking.
+        snapshot = self.latest
+        if (snapshot.left_velocity or snapshot.right_velocity) and time.monotonic() - snapshot.timestamp > STALL_TIMEOUT:
+            snapshot = snapshot._replace(left_velocity=0.0, right_velocity=0.0, velocity=0.0)
+        return snapshot
+
+    def close(self):
+        self.left.close()
+        self.right.close()
@@ -1,13 +1,106 @@
 import math
-from rplidar import RPLidar
-from time import sleep
-from gpiozero import DistanceSensor
+import time
+import threading
+from collections import deque
+from itertools import takewhile
+import numpy as np
 
 ## Ultrasonic sensor setup 
-distance_sensor = DistanceSensor(echo=12, trigger=16, max_distance=2.5)
-def is_tall_object_present(lidar_distance_mm, tolerance_mm=150):
-    # Returns true if the ultrasonic sensor detects an object near the LiDAR
-    measured_mm = distance_sensor.distance * 1000
+distance_sensor = None  # Created by init_distance_sensor
+
+def init_distance_sensor(pin_factory=None):
+    global distance_sensor
+    if distance_sensor is None:
+        # Imported here so the perception pipeline can be used without gpiozero
+        from gpiozero import DistanceSensor
+        distance_sensor = DistanceSensor(echo=12, trigger=16, max_distance=2.5, pin_factory=pin_factory)
+    return distance_sensor
+
+class RangeSampler:
+    # Polls the ultrasonic sensor at a fixed rate in a background thread into a timestamped ring
+    # buffer. Queries only look at the buffer, so they never wait on an echo.
+    def __init__(self, read_distance_mm, rate_hz=20, buffer_size=32):
+        self.read_distance_mm = read_distance_mm
+        self.period = 1 / rate_hz
+        self.timestamps = np.full(buffer_size, -np.inf)
+        self.readings = np.zeros(buffer_size)
+        self.index = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                reading = self.read_distance_mm()
+            except Exception as e:
+                print(f"Ultrasonic sensor error: {e}")
+                reading = None
+
+            if reading is not None:
+                with self.lock:
+                    self.timestamps[self.index] = time.monotonic()
+                    self.readings[self.index] = reading
+                    self.index = (self.index + 1) % len(self.readings)
+
+            # Fixed rate: schedule from the previous deadline, not from when the read finished
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                next_time = time.monotonic()
+                delay = 0
+            self.stop_event.wait(delay)
+
+    def percentile(self, q, window_s=0.2):
+        # Percentile of the readings taken in the last window_s seconds, or None if there are none
+        with self.lock:
+            recent = self.readings[self.timestamps >= time.monotonic() - window_s]
+        if len(recent) == 0:
+            return None
+        return float(np.percentile(recent, q))
+
+    def median(self, window_s=0.2):
+        return self.percentile(50, window_s)
+
+range_sampler = None
+
+def start_range_sampler(rate_hz=20):
+    global range_sampler
+    if range_sampler is None:
+        sensor = init_distance_sensor()
+        range_sampler = RangeSampler(lambda: sensor.distance * 1000, rate_hz)
+    range_sampler.start()
+    return range_sampler
+
+def stop_range_sampler():
+    global range_sampler
+    if range_sampler is not None:
+        range_sampler.stop()
+        range_sampler = None
+
+def is_tall_object_present(lidar_distance_mm, tolerance_mm=150, window_s=0.2):
+    # Returns true if the ultrasonic sensor detects an object near the LiDAR, using the median
+    # of the recent background readings so a single noisy echo cannot decide it
+    measured_mm = range_sampler.median(window_s) if range_sampler is not None else None
+    if measured_mm is None:
+        measured_mm = init_distance_sensor().distance * 1000
     print(f"Ultrasonic Sensor measured distance: {measured_mm:.0f} mm")
 
     if abs(measured_mm - lidar_distance_mm) <= tolerance_mm:
@@ -24,176 +117,649 @@ def polar_to_cartesian(angle_deg, distance_mm):
 def euclidean_distance(p1, p2):
     return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
-def detect_object_of_interest(
+## LiDAR scanner service ##
+LIDAR_PORT = '/dev/ttyUSB0'
+FOV_MIN_DEG = 225
+FOV_MAX_DEG = 315
+LIDAR_MAX_RANGE_MM = 6000
+REVOLUTION_CAPACITY = 4096  # Max in-FOV points kept per revolution
+
+def open_lidar():
+    # Imported here so recordings and fakes can stand in for the LiDAR without rplidar installed
+    from rplidar import RPLidar
+    return RPLidar(LIDAR_PORT)
+
+class RevolutionBuffer:
+    # Preallocated ring of revolution slots. Each slot holds the angle and distance arrays
+    # of one revolution and is reused once the ring wraps around.
+    def __init__(self, slots=8, capacity=REVOLUTION_CAPACITY):
+        self.slots = slots
+        self.capacity = capacity
+        self.angles = np.zeros((slots, capacity))
+        self.distances = np.zeros((slots, capacity))
+
+def assemble_revolutions(
+    measures,
+    buffer,
+    fov_min_deg=FOV_MIN_DEG,
+    fov_max_deg=FOV_MAX_DEG,
+    max_distance=LIDAR_MAX_RANGE_MM
+):
+    # Streams (new_scan, quality, angle, distance) measurements into the buffer, dropping points
+    # outside the field of view as they arrive. Yields (slot, count, start_time, end_time) for every
+    # completed revolution; the points are buffer.angles[slot, :count] and buffer.distances[slot, :count].
+    # A revolution ends when the angle wraps from the top of the circle back to 0. The wrap only
+    # counts once the angle has reached the far half of the circle, so jitter around 0 cannot
+    # split a revolution.
+    slot = 0
+    count = 0
+    angles = buffer.angles[slot]
+    distances = buffer.distances[slot]
+
+    started = False  # Discard the partial revolution before the first wrap
+    armed = False
+    previous_angle = 0.0
+    start_time = time.monotonic()
+
+    for _, _, angle, distance in measures:
+        angle %= 360
+
+        if armed and angle < previous_angle - 180:
+            now = time.monotonic()
+            if started:
+                yield slot, count, start_time, now
+                slot = (slot + 1) % buffer.slots
+                angles = buffer.angles[slot]
+                distances = buffer.distances[slot]
+            started = True
+            armed = False
+            count = 0
+            start_time = now
+        elif not armed and 90 <= angle <= 270:
+            armed = True
+        previous_angle = angle
+
+        if fov_min_deg <= angle <= fov_max_deg and 0 < distance <= max_distance and count < buffer.capacity:
+            angles[count] = angle
+            distances[count] = distance
+            count += 1
+
+class LidarScanner:
+    # Owns the RPLidar in a background thread and keeps the motor spinning between scans.
+    # The last complete revolutions are kept in a ring buffer so detection only reads memory.
+    # device_factory returns any object with the RPLidar interface (start_motor, iter_measures,
+    # stop, stop_motor, disconnect), so a fake device can drive the scanner.
+    def __init__(self, device_factory=None, buffer_size=8, max_distance=LIDAR_MAX_RANGE_MM):
+        self.device_factory = device_factory or open_lidar
+        self.max_distance = max_distance
+        # One slot is always being written, the others hold completed revolutions
+        self.buffer = RevolutionBuffer(buffer_size + 1)
+        self.revolutions = deque(maxlen=buffer_size)  # (start_time, end_time, slot, count)
+        self.revolution_count = 0
+        self.callbacks = []
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def add_revolution_callback(self, callback):
+        # callback(angles, distances, start_time, end_time) runs in the scanner thread for every
+        # completed revolution. The arrays are views into the ring and are only valid during the call.
+        if callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self):
+        lidar = None
+        try:
+            lidar = self.device_factory()
+            lidar.start_motor()
+
+            measures = takewhile(lambda _: not self.stop_event.is_set(), lidar.iter_measures())
+            for slot, count, start_time, end_time in assemble_revolutions(measures, self.buffer, max_distance=self.max_distance):
+                # The deque drops the oldest revolution here, before its slot is written again
+                with self.condition:
+                    self.revolutions.append((start_time, end_time, slot, count))
+                    self.revolution_count += 1
+                    self.condition.notify_all()
+
+                angles = self.buffer.angles[slot, :count]
+                distances = self.buffer.distances[slot, :count]
+                for callback in self.callbacks:
+                    try:
+                        callback(angles, distances, start_time, end_time)
+                    except Exception as e:
+                        print(f"LiDAR revolution callback error: {e}")
+        except Exception as e:
+            self.error = e
+            print(f"LiDAR scanner error: {e}")
+        finally:
+            if lidar is not None:
+                try:
+                    lidar.stop()
+                    lidar.stop_motor()
+                    lidar.disconnect()
+                except Exception as e:
+                    print(f"LiDAR cleanup error: {e}")
+            with self.condition:
+                self.condition.notify_all()
+
+    def get_revolutions(self, count, since=None, timeout=3.0):
+        # Returns the latest `count` revolutions that started at or after `since` (time.monotonic)
+        # as (angles, distances) arrays, waiting up to `timeout` seconds for them. Returns fewer
+        # if the wait times out. Arrays are copied out because the slots are reused.
+        deadline = time.monotonic() + timeout
+
+        def fresh():
+            return [rev for rev in self.revolutions if since is None or rev[0] >= since]
+
+        with self.condition:
+            revolutions = fresh()
+            while len(revolutions) < count and self.is_running():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+                revolutions = fresh()
+
+            scans = [
+                (self.buffer.angles[slot, :n].copy(), self.buffer.distances[slot, :n].copy())
+                for _, _, slot, n in revolutions[-count:]
+            ]
+
+        if len(scans) < count:
+            print(f"Only {len(scans)} of {count} LiDAR revolutions available.")
+
+        return scans
+
+lidar_scanner = None
+
+def start_lidar_scanner(device_factory=None, buffer_size=8, max_distance=LIDAR_MAX_RANGE_MM):
+    global lidar_scanner
+    if lidar_scanner is None:
+        lidar_scanner = LidarScanner(device_factory, buffer_size, max_distance)
+        lidar_scanner.add_revolution_callback(track_revolution)
+    lidar_scanner.start()
+    return lidar_scanner
+
+def stop_lidar_scanner():
+    global lidar_scanner
+    if lidar_scanner is not None:
+        lidar_scanner.stop()
+        lidar_scanner = None
+
+def find_objects_in_revolution(
+    scan_points,
     min_physical_width_mm=25,
     big_object_threshold_mm=150,
     max_gap_mm=300,
     max_distance=2000,
     min_points=2,
-    max_attempts=4,
     merge_cluster_threshold_mm=150
 ):
-    PORT_NAME = '/dev/ttyUSB0'
-    lidar = RPLidar(PORT_NAME)
-    lidar.start_motor()
-    sleep(1)
-
-    attempt = 0
     objects_detected = []
 
-    print(f"\nScanning for objects in the 225° to 315° field of view... (max {max_attempts} attempts)")
+    filtered_points = [pt for pt in scan_points if 225 <= pt[0] <= 315 and 0 < pt[1] <= max_distance]
+    filtered_points.sort()
 
-    try:
-        scan_points = []
+    cartesian_points = [(ang, polar_to_cartesian(ang, dist), dist) for ang, dist in filtered_points]
 
-        for scan in lidar.iter_measures():
-            quality, _, angle, distance = scan
-            if 0 < distance <= max_distance:
-                scan_points.append((angle % 360, distance))
+    # Initial distance-based clustering
+    clusters = []
+    current_cluster = []
 
-            if angle % 360 < 1.0:
-                attempt += 1
+    for i in range(len(cartesian_points)):
+        if not current_cluster:
+            current_cluster.append(cartesian_points[i])
+        else:
+            dist = euclidean_distance(current_cluster[-1][1], cartesian_points[i][1])
+            if dist <= max_gap_mm:
+                current_cluster.append(cartesian_points[i])
+            else:
+                if len(current_cluster) >= min_points:
+                    clusters.append(current_cluster)
+                current_cluster = [cartesian_points[i]]
 
-                filtered_points = [pt for pt in scan_points if 225 <= pt[0] <= 315]
-                filtered_points.sort()
+    if current_cluster and len(current_cluster) >= min_points:
+        clusters.append(current_cluster)
 
-                cartesian_points = [(ang, polar_to_cartesian(ang, dist), dist) for ang, dist in filtered_points]
+    # Merge nearby clusters
+    merged = [False] * len(clusters)
+    final_clusters = []
 
-                # Initial distance-based clustering
-                clusters = []
-                current_cluster = []
+    for i in range(len(clusters)):
+        if merged[i]:
+            continue
+        merged[i] = True
+        base_cluster = clusters[i]
+        base_points = [pt[1] for pt in base_cluster]
+        base_center = (
+            sum([p[0] for p in base_points]) / len(base_points),
+            sum([p[1] for p in base_points]) / len(base_points)
+        )
+        for j in range(i + 1, len(clusters)):
+            if merged[j]:
+                continue
+            compare_points = [pt[1] for pt in clusters[j]]
+            compare_center = (
+                sum([p[0] for p in compare_points]) / len(compare_points),
+                sum([p[1] for p in compare_points]) / len(compare_points)
+            )
+            if euclidean_distance(base_center, compare_center) <= merge_cluster_threshold_mm:
+                base_cluster += clusters[j]
+                merged[j] = True
+        final_clusters.append(base_cluster)
+
+    # Analyze merged clusters
+    for cluster in final_clusters:
+        angles = [pt[0] for pt in cluster]
+        distances = [pt[2] for pt in cluster]
+
+        angles_sorted = sorted(angles)
+
+        if len(angles_sorted) >= 2:
+            diffs = [angles_sorted[i+1] - angles_sorted[i] for i in range(len(angles_sorted)-1)]
+            avg_step = sum(diffs) / len(diffs)
+            estimated_from_steps = avg_step * (len(angles_sorted) - 1)
+            direct_span = angles_sorted[-1] - angles_sorted[0]
+            estimated_span = max(estimated_from_steps, direct_span)
+        else:
+            estimated_span = 0
+
+        avg_distance = sum(distances) / len(distances)
+        if avg_distance <= 250 and estimated_span < 20:
+            estimated_span = 20  # enforce a minimum span for close objects
+
+        center_angle = (angles_sorted[0] + estimated_span / 2) % 360
+        width = 2 * avg_distance * math.tan(math.radians(estimated_span / 2))
+
+        if width < min_physical_width_mm:
+            continue
 
-                for i in range(len(cartesian_points)):
-                    if not current_cluster:
-                        current_cluster.append(cartesian_points[i])
-                    else:
-                        dist = euclidean_distance(current_cluster[-1][1], cartesian_points[i][1])
-                        if dist <= max_gap_mm:
-                            current_cluster.append(cartesian_points[i])
-                        else:
-                            if len(current_cluster) >= min_points:
-                                clusters.append(current_cluster)
-                            current_cluster = [cartesian_points[i]]
+        objects_detected.append(describe_object(width, avg_distance, center_angle, big_object_threshold_mm))
+
+    return objects_detected
+
+def describe_object(width, avg_distance, center_angle, big_object_threshold_mm=150):
+    size_class = "big" if width >= big_object_threshold_mm else "small"
+
+    # Signed angle relative to 270°
+    raw_relative = (center_angle - 270 + 540) % 360 - 180
+    relative_angle = round(raw_relative, 1)
+
+    return {
+        'width_mm': int(width),
+        'distance_mm': int(avg_distance),
+        'angle_center_deg': round(center_angle, 1),
+        'relative_angle_deg': relative_angle,
+        'size_class': size_class
+    }
+
+def print_object(obj):
+    direction = f"{obj['relative_angle_deg']:+.1f} degrees relative to 270"
+    print(f" -> Detected object: ({obj['size_class']}, {obj['distance_mm']} mm, {direction})")
+
+## Spatial index ##
+class GridIndex:
+    # Uniform grid hash over 2D keys. With the cell size equal to the match tolerance on each axis,
+    # every item within tolerance of a query lies in the 3x3 block of cells around it.
+    def __init__(self, cell_x, cell_y):
+        self.cell_x = cell_x
+        self.cell_y = cell_y
+        self.cells = {}
+
+    def cell(self, x, y):
+        return (math.floor(x / self.cell_x), math.floor(y / self.cell_y))
+
+    def insert(self, item, x, y):
+        self.cells.setdefault(self.cell(x, y), []).append(item)
+
+    def nearby(self, x, y):
+        cx, cy = self.cell(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self.cells.get((cx + dx, cy + dy), ())
+
+## Vectorized scan-to-clusters pipeline ##
+# Same detections as find_objects_in_revolution, with every stage done as array operations.
+
+def filter_fov(angles, distances, max_distance=2000):
+    # Keep valid points inside the field of view, sorted by angle then distance
+    mask = (angles >= FOV_MIN_DEG) & (angles <= FOV_MAX_DEG) & (distances > 0) & (distances <= max_distance)
+    angles = angles[mask]
+    distances = distances[mask]
+    order = np.lexsort((distances, angles))
+    return angles[order], distances[order]
+
+def to_cartesian(angles, distances):
+    angles_rad = np.radians(angles)
+    return distances * np.cos(angles_rad), distances * np.sin(angles_rad)
+
+def segment_gaps(x, y, max_gap_mm=300, min_points=2):
+    # Split the angle-ordered points wherever consecutive points are further apart than max_gap_mm.
+    # Returns the start and end (exclusive) index of each segment with at least min_points points.
+    n = len(x)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+    gaps = np.hypot(np.diff(x), np.diff(y))
+    breaks = np.flatnonzero(gaps > max_gap_mm) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [n]))
+
+    keep = (ends - starts) >= min_points
+    return starts[keep], ends[keep]
+
+def segment_centroids(x, y, starts, ends):
+    counts = ends - starts
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    return (x_sums[ends] - x_sums[starts]) / counts, (y_sums[ends] - y_sums[starts]) / counts
+
+def merge_clusters(x, y, starts, ends, merge_cluster_threshold_mm=150):
+    # Greedy merge: each unmerged segment absorbs every later unmerged segment whose centroid
+    # is within the threshold of its own. Returns the base segment index for every segment.
+    # Centroids are computed once and only segments in neighbouring grid cells are compared.
+    center_x, center_y = segment_centroids(x, y, starts, ends)
+    center_x = center_x.tolist()
+    center_y = center_y.tolist()
+    labels = np.full(len(starts), -1, dtype=np.intp)
+
+    grid = GridIndex(merge_cluster_threshold_mm, merge_cluster_threshold_mm)
+    for i in range(len(starts)):
+        grid.insert(i, center_x[i], center_y[i])
+
+    for i in range(len(starts)):
+        if labels[i] >= 0:
+            continue
+        labels[i] = i
+        for j in grid.nearby(center_x[i], center_y[i]):
+            if j > i and labels[j] < 0:
+                if math.hypot(center_x[j] - center_x[i], center_y[j] - center_y[i]) <= merge_cluster_threshold_mm:
+                    labels[j] = i
+
+    return labels
+
+def analyze_clusters(
+    angles,
+    distances,
+    starts,
+    ends,
+    labels,
+    min_physical_width_mm=25,
+    big_object_threshold_mm=150
+):
+    if len(starts) == 0:
+        return []
+
+    # Cluster label for every point that belongs to a kept segment
+    lengths = ends - starts
+    point_index = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+    point_labels = np.repeat(labels, lengths)
+
+    order = np.argsort(point_labels, kind="stable")
+    point_labels = point_labels[order]
+    point_index = point_index[order]
+
+    cluster_ids, cluster_starts, counts = np.unique(point_labels, return_index=True, return_counts=True)
+    cluster_angles = angles[point_index]
+    min_angles = np.minimum.reduceat(cluster_angles, cluster_starts)
+    max_angles = np.maximum.reduceat(cluster_angles, cluster_starts)
+    avg_distances = np.add.reduceat(distances[point_index], cluster_starts) / counts
+
+    spans = np.where(counts >= 2, max_angles - min_angles, 0.0)
+    spans = np.where((avg_distances <= 250) & (spans < 20), 20.0, spans)  # enforce a minimum span for close objects
+
+    center_angles = (min_angles + spans / 2) % 360
+    widths = 2 * avg_distances * np.tan(np.radians(spans / 2))
+
+    return [
+        describe_object(width, avg_distance, center_angle, big_object_threshold_mm)
+        for width, avg_distance, center_angle in zip(widths.tolist(), avg_distances.tolist(), center_angles.tolist())
+        if width >= min_physical_width_mm
+    ]
+
+def find_objects_in_arrays(
+    angles,
+    distances,
+    min_physical_width_mm=25,
+    big_object_threshold_mm=150,
+    max_gap_mm=300,
+    max_distance=2000,
+    min_points=2,
+    merge_cluster_threshold_mm=150
+):
+    angles, distances = filter_fov(np.asarray(angles, dtype=float), np.asarray(distances, dtype=float), max_distance)
+    x, y = to_cartesian(angles, distances)
+    starts, ends = segment_gaps(x, y, max_gap_mm, min_points)
+    labels = merge_clusters(x, y, starts, ends, merge_cluster_threshold_mm)
+    return analyze_clusters(angles, distances, starts, ends, labels, min_physical_width_mm, big_object_threshold_mm)
+
+## Multi-revolution object tracking ##
+DETECTION_PARAMS = {
+    'min_physical_width_mm': 25,
+    'big_object_threshold_mm': 150,
+    'max_gap_mm': 300,
+    'max_distance': 2000,
+    'min_points': 2,
+    'merge_cluster_threshold_mm': 150
+}
+
+class Track:
+    # One object followed across revolutions with a constant-velocity alpha-beta filter on its
+    # position (mm). With a pose source the position is in the world frame, so the robot's own motion
+    # is not mistaken for object motion; without one it is the LiDAR frame (x to the right, y ahead).
+    def __init__(self, track_id, obj, x, y, timestamp):
+        self.track_id = track_id
+        self.x = x
+        self.y = y
+        self.vx = 0.0
+        self.vy = 0.0
+        self.width = obj['width_mm']
+        self.max_width = obj['width_mm']
+        self.size_class = obj['size_class']
+        self.hits = 1
+        self.misses = 0
+        self.last_time = timestamp
+
+        # Running mean and variance of the measured position (Welford)
+        self.mean_x = x
+        self.mean_y = y
+        self.m2_position = 0.0
+
+    def predict(self, timestamp):
+        dt = timestamp - self.last_time
+        return self.x + self.vx * dt, self.y + self.vy * dt
+
+    def update(self, obj, x, y, timestamp, alpha, beta):
+        dt = timestamp - self.last_time
+        predicted_x, predicted_y = self.predict(timestamp)
+        residual_x = x - predicted_x
+        residual_y = y - predicted_y
+
+        self.x = predicted_x + alpha * residual_x
+        self.y = predicted_y + alpha * residual_y
+        if dt > 0:
+            self.vx += beta * residual_x / dt
+            self.vy += beta * residual_y / dt
+        self.width = alpha * obj['width_mm'] + (1 - alpha) * self.width
+        if obj['width_mm'] >= self.max_width:
+            self.max_width = obj['width_mm']
+            self.size_class = obj['size_class']
+
+        self.hits += 1
+        self.misses = 0
+        self.last_time = timestamp
+
+        delta_x = x - self.mean_x
+        delta_y = y - self.mean_y
+        self.mean_x += delta_x / self.hits
+        self.mean_y += delta_y / self.hits
+        self.m2_position += delta_x * (x - self.mean_x) + delta_y * (y - self.mean_y)
+
+    def as_object(self, pose=None):
+        # Relative to the robot at `pose` (x cm, y cm, heading degrees), or to the LiDAR frame without one
+        x, y = self.x, self.y
+        heading = 0.0
+        if pose is not None:
+            x -= pose[0] * 10
+            y -= pose[1] * 10
+            heading = pose[2]
+        distance = math.hypot(x, y)
+        relative_angle = (math.degrees(math.atan2(x, y)) - heading + 180) % 360 - 180
+        return {
+            'width_mm': int(self.width),
+            'distance_mm': int(distance),
+            'angle_center_deg': round((270 + relative_angle) % 360, 1),
+            'relative_angle_deg': round(relative_angle, 1),
+            'size_class': self.size_class,
+            'track_id': self.track_id,
+            'hits': self.hits,
+            'position_variance_mm2': self.m2_position / (self.hits - 1) if self.hits > 1 else 0.0,
+            'last_seen': self.last_time
+        }
+
+class ObjectTracker:
+    # Associates each revolution's detections with existing tracks by nearest neighbour within
+    # gate_mm of the predicted position. Tracks are confirmed after min_hits and dropped after
+    # max_misses revolutions without a detection. pose_source(timestamp) returns the robot pose
+    # (x cm, y cm, heading degrees) at a time.monotonic() timestamp, e.g. navigation.pose_at.
+    def __init__(self, gate_mm=150, min_hits=2, max_misses=2, alpha=0.5, beta=0.1, pose_source=None):
+        self.gate_mm = gate_mm
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.alpha = alpha
+        self.beta = beta
+        self.pose_source = pose_source
+        self.tracks = []
+        self.next_track_id = 1
+        self.update_times = deque(maxlen=32)  # Start time of each revolution the tracker has seen
+        self.condition = threading.Condition()
+
+    def _pose(self, timestamp):
+        if self.pose_source is None:
+            return None
+        return tuple(self.pose_source(timestamp))[1:4]
+
+    def update(self, objects, start_time, timestamp):
+        # Robot pose halfway through the revolution
+        pose = self._pose((start_time + timestamp) / 2)
+        origin_x, origin_y, heading = (0.0, 0.0, 0.0) if pose is None else (pose[0] * 10, pose[1] * 10, pose[2])
+        with self.condition:
+            grid = GridIndex(self.gate_mm, self.gate_mm)
+            predictions = []
+            for i, track in enumerate(self.tracks):
+                px, py = track.predict(timestamp)
+                predictions.append((px, py))
+                grid.insert(i, px, py)
+
+            # Candidate pairs within the gate, assigned closest first
+            positions = []
+            pairs = []
+            for j, obj in enumerate(objects):
+                bearing = math.radians(heading + obj['relative_angle_deg'])
+                x = origin_x + obj['distance_mm'] * math.sin(bearing)
+                y = origin_y + obj['distance_mm'] * math.cos(bearing)
+                positions.append((x, y))
+                for i in grid.nearby(x, y):
+                    gap = math.hypot(predictions[i][0] - x, predictions[i][1] - y)
+                    if gap <= self.gate_mm:
+                        pairs.append((gap, i, j))
+            pairs.sort()
+
+            matched_tracks = set()
+            matched_objects = set()
+            for _, i, j in pairs:
+                if i in matched_tracks or j in matched_objects:
+                    continue
+                self.tracks[i].update(objects[j], *positions[j], timestamp, self.alpha, self.beta)
+                matched_tracks.add(i)
+                matched_objects.add(j)
+
+            for i, track in enumerate(self.tracks):
+                if i not in matched_tracks:
+                    track.misses += 1
+            self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+            for j, obj in enumerate(objects):
+                if j not in matched_objects:
+                    self.tracks.append(Track(self.next_track_id, obj, *positions[j], timestamp))
+                    self.next_track_id += 1
+
+            self.update_times.append(start_time)
+            self.condition.notify_all()
+
+    def wait_for_updates(self, count, since=None, timeout=3.0):
+        # Waits until `count` revolutions that started at or after `since` have been tracked
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while sum(1 for t in self.update_times if since is None or t >= since) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
 
-                if current_cluster and len(current_cluster) >= min_points:
-                    clusters.append(current_cluster)
+    def get_confirmed_objects(self, since=None):
+        # Confirmed tracks seen at or after `since`, closest first, relative to the robot's latest pose
+        pose = self._pose(time.monotonic())
+        with self.condition:
+            objects = [
+                track.as_object(pose) for track in self.tracks
+                if track.hits >= self.min_hits and (since is None or track.last_time >= since)
+            ]
+        objects.sort(key=lambda obj: obj['distance_mm'])
+        return objects
 
-                # Merge nearby clusters
-                merged = [False] * len(clusters)
-                final_clusters = []
-
-                for i in range(len(clusters)):
-                    if merged[i]:
-                        continue
-                    merged[i] = True
-                    base_cluster = clusters[i]
-                    base_points = [pt[1] for pt in base_cluster]
-                    base_center = (
-                        sum([p[0] for p in base_points]) / len(base_points),
-                        sum([p[1] for p in base_points]) / len(base_points)
-                    )
-                    for j in range(i + 1, len(clusters)):
-                        if merged[j]:
-                            continue
-                        compare_points = [pt[1] for pt in clusters[j]]
-                        compare_center = (
-                            sum([p[0] for p in compare_points]) / len(compare_points),
-                            sum([p[1] for p in compare_points]) / len(compare_points)
-                        )
-                        if euclidean_distance(base_center, compare_center) <= merge_cluster_threshold_mm:
-                            base_cluster += clusters[j]
-                            merged[j] = True
-                    final_clusters.append(base_cluster)
-
-                # Analyze merged clusters
-                for cluster in final_clusters:
-                    angles = [pt[0] for pt in cluster]
-                    distances = [pt[2] for pt in cluster]
-
-                    angles_sorted = sorted(angles)
-
-                    if len(angles_sorted) >= 2:
-                        diffs = [angles_sorted[i+1] - angles_sorted[i] for i in range(len(angles_sorted)-1)]
-                        avg_step = sum(diffs) / len(diffs)
-                        estimated_from_steps = avg_step * (len(angles_sorted) - 1)
-                        direct_span = angles_sorted[-1] - angles_sorted[0]
-                        estimated_span = max(estimated_from_steps, direct_span)
-                    else:
-                        estimated_span = 0
-
-                    avg_distance = sum(distances) / len(distances)
-                    if avg_distance <= 250 and estimated_span < 20:
-                        estimated_span = 20  # enforce a minimum span for close objects
-
-                    center_angle = (angles_sorted[0] + estimated_span / 2) % 360
-                    width = 2 * avg_distance * math.tan(math.radians(estimated_span / 2))
-
-                    if width < min_physical_width_mm:
-                        continue
-
-                    size_class = "big" if width >= big_object_threshold_mm else "small"
-
-                    # Signed angle relative to 270°
-                    raw_relative = (center_angle - 270 + 540) % 360 - 180
-                    relative_angle = round(raw_relative, 1)
-                    direction = f"{relative_angle:+.1f} degrees relative to 270"
-
-                    print(f" -> Detected object: ({size_class}, {int(avg_distance)} mm, {direction})")
-
-                    objects_detected.append({
-                        'width_mm': int(width),
-                        'distance_mm': int(avg_distance),
-                        'angle_center_deg': round(center_angle, 1),
-                        'relative_angle_deg': relative_angle,
-                        'size_class': size_class
-                    })
-
-                if attempt >= max_attempts:
-                    print("Max attempts reached.")
-                    break
+    def reset(self):
+        with self.condition:
+            self.tracks = []
+            self.update_times.clear()
 
-                scan_points = []
+object_tracker = ObjectTracker()
 
-    finally:
-        lidar.stop()
-        lidar.stop_motor()
-        lidar.disconnect()
+def track_revolution(angles, distances, start_time, end_time):
+    objects = find_objects_in_arrays(angles, distances, **DETECTION_PARAMS)
+    object_tracker.update(objects, start_time, end_time)
 
-    # sort and remove duplicate objects
-    deduped = []
-    used = [False] * len(objects_detected)
+def set_pose_source(pose_source):
+    # Track objects in the world frame from the robot pose, see ObjectTracker
+    object_tracker.pose_source = pose_source
 
-    for i, obj in enumerate(objects_detected):
-        if used[i]:
-            continue
+def get_confirmed_objects(since=None):
+    return object_tracker.get_confirmed_objects(since)
 
-        group = [obj]
-        used[i] = True
+def detect_object_of_interest(since=None, min_revolutions=2, timeout=3.0):
+    # Returns the closest confirmed object from the tracker, or None. Pass `since` (time.monotonic)
+    # to wait for `min_revolutions` revolutions that started after the robot stopped.
+    start_lidar_scanner()
 
-        for j in range(i + 1, len(objects_detected)):
-            if used[j]:
-                continue
+    print(f"\nScanning for objects in the 225° to 315° field of view...")
+
+    if not object_tracker.wait_for_updates(min_revolutions, since, timeout):
+        print("Timed out waiting for LiDAR revolutions.")
+
+    objects = object_tracker.get_confirmed_objects(since)
+    for obj in objects:
+        print_object(obj)
 
-            other = objects_detected[j]
-            angle_diff = abs(obj['relative_angle_deg'] - other['relative_angle_deg'])
-            dist_diff = abs(obj['distance_mm'] - other['distance_mm'])
-
-            if angle_diff <= 2 and dist_diff <= 150:
-                group.append(other)
-                used[j] = True
-
-        if group:
-            avg_obj = {
-                'width_mm': int(sum(o['width_mm'] for o in group) / len(group)),
-                'distance_mm': int(sum(o['distance_mm'] for o in group) / len(group)),
-                'angle_center_deg': round(sum(o['angle_center_deg'] for o in group) / len(group), 1),
-                'relative_angle_deg': round(sum(o['relative_angle_deg'] for o in group) / len(group), 1),
-                'size_class': max(group, key=lambda o: o['width_mm'])['size_class']
-            }
-            deduped.append(avg_obj)
-
-    if deduped:
-        deduped.sort(key=lambda obj: obj['distance_mm'])  # Sort by distance
-        return deduped[0]  # Return the closest object
+    if objects:
+        return objects[0]  # Return the closest object
     else:
-        return None
\ No newline at end of file
+        return None
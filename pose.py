@@ -0,0 +1,73 @@
+# Import libraries
+from math import sin, cos, radians
+from collections import namedtuple
+import numpy as np
+
+## Pose estimator ##
+# Dead-reckoned 2D pose from the encoder distance and the IMU heading. Each update is O(1) and the
+# result is published as one immutable snapshot, so readers never mix values from different updates.
+# x grows to the right of the starting direction, y along it (cm). heading is in degrees, 0 along
+# the starting direction and clockwise positive, not wrapped. distance is the signed path length s
+# (cm): driving out to an object and reversing back leaves it unchanged.
+POSE_HISTORY = 512  # Updates kept for pose_at, about 5 s at the IMU rate
+
+PoseSnapshot = namedtuple("PoseSnapshot", "timestamp x y heading distance")
+
+class PoseEstimator:
+    __slots__ = ("x", "y", "heading", "distance", "timestamp", "last_odometry", "latest", "history", "updates")
+
+    def __init__(self, history_size=POSE_HISTORY):
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0
+        self.distance = 0.0
+        self.timestamp = None
+        self.last_odometry = None
+        self.latest = PoseSnapshot(None, 0.0, 0.0, 0.0, 0.0)
+        # Preallocated ring of (timestamp, x, y, heading, distance) rows
+        self.history = np.zeros((history_size, 5))
+        self.updates = 0
+
+    def update(self, odometry_distance, heading, timestamp):
+        # Advance along the mean of the previous and new heading by the encoder distance since the last
+        # update. Only one thread may call this (the IMU sampler).
+        if self.last_odometry is None:
+            delta = 0.0
+        else:
+            delta = odometry_distance - self.last_odometry
+        self.last_odometry = odometry_distance
+
+        bearing = radians((self.heading + heading) / 2) if self.timestamp is not None else radians(heading)
+        self.x += delta * sin(bearing)
+        self.y += delta * cos(bearing)
+        self.heading = heading
+        self.distance += delta
+        self.timestamp = timestamp
+
+        self.history[self.updates % len(self.history)] = (timestamp, self.x, self.y, heading, self.distance)
+        self.updates += 1
+        self.latest = PoseSnapshot(timestamp, self.x, self.y, heading, self.distance)
+        return self.latest
+
+    def snapshot(self):
+        return self.latest
+
+    def pose_at(self, timestamp):
+        # Pose at a time.monotonic() timestamp, interpolated between the updates around it and clamped
+        # to the oldest and newest retained updates
+        updates = self.updates
+        if updates == 0:
+            return self.latest
+        history_size = len(self.history)
+        order = np.arange(max(updates - history_size, 0), updates) % history_size
+        rows = self.history[order]
+
+        i = np.searchsorted(rows[:, 0], timestamp)
+        if i == 0:
+            return PoseSnapshot(*rows[0].tolist())
+        if i == len(rows):
+            return PoseSnapshot(*rows[-1].tolist())
+        before, after = rows[i - 1], rows[i]
+        span = after[0] - before[0]
+        weight = (timestamp - before[0]) / span if span > 0 else 1.0
+        return PoseSnapshot(timestamp, *(before[1:] + weight * (after[1:] - before[1:])).tolist())
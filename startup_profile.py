@@ -0,0 +1,41 @@
+# Import libraries
+import sys
+import time
+from contextlib import contextmanager
+
+## Startup profiler ##
+# Times every import and initialisation step of main.py. Run "python main.py --profile-startup" to
+# print the report once everything is up and exit without moving.
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+
+class StartupProfile:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = []      # (name, kind, seconds) in the order they ran
+        self.milestones = []  # (name, seconds since start)
+
+    @contextmanager
+    def stage(self, name, kind="init"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, kind, time.perf_counter() - start))
+
+    def mark(self, name):
+        self.milestones.append((name, self.elapsed()))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def report(self):
+        print("Startup profile:")
+        for name, kind, seconds in self.stages:
+            print(f"  {kind:>6} {name:<28} {seconds * 1000:8.1f} ms")
+        for kind in ("import", "init"):
+            total = sum(seconds for _, stage_kind, seconds in self.stages if stage_kind == kind)
+            print(f"  {kind:>6} total {'':<22} {total * 1000:8.1f} ms")
+        for name, seconds in self.milestones:
+            print(f"  {name} after {seconds:.2f} s")
+
+startup_profile = StartupProfile()
@@ -0,0 +1,109 @@
+# Import libraries
+import os
+import sys
+import json
+import time
+import numpy as np
+import torch
+from PIL import Image
+
+# Import modules
+from classification import (load_imagenet_classes, PTH_MODEL_PATH, PKL_MODEL_PATH, BURST_SIZE, load_pth_model,
+                            load_pkl_model, frame_to_tensor, garbage_batch)
+from inference_backends import BACKENDS, create_backend, export_backend
+
+## Compare inference backends for both classification layers
+# Usage: python backend_benchmark.py <first layer image folder> [garbage image folder] [results.json]
+# Each image folder has one subfolder per label: ImageNet class names (as in model_weight.txt) for the
+# first layer and the garbage model's vocab for the second. Every backend is exported fresh, then
+# checked for top-1 accuracy and agreement with the eager model and timed at batch 1 and burst size.
+first_layer_folder = sys.argv[1]
+garbage_folder = sys.argv[2] if len(sys.argv) > 2 else None
+output_path = sys.argv[3] if len(sys.argv) > 3 else "backend_benchmark.json"
+
+def load_folder(folder):
+    frames, labels = [], []
+    for label in sorted(os.listdir(folder)):
+        label_dir = os.path.join(folder, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for name in sorted(os.listdir(label_dir)):
+            try:
+                frames.append(np.asarray(Image.open(os.path.join(label_dir, name)).convert("RGB")))
+                labels.append(label)
+            except OSError:
+                continue
+    return frames, labels
+
+def median_latency_ms(model, batch, repeats=10):
+    model(batch)  # Warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(batch)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+def evaluate(model, batches, labels, vocab):
+    predictions = []
+    for batch in batches:
+        predictions += model(batch).argmax(1).tolist()
+    predicted_labels = [vocab[p] for p in predictions]
+    accuracy = sum(p.lower() == l.lower() for p, l in zip(predicted_labels, labels)) / max(len(labels), 1)
+    return predicted_labels, accuracy
+
+def benchmark_layer(name, load_model, example_input, source_path, batches, labels, vocab):
+    print(f"\n{name}: {len(labels)} labelled images")
+    results = {}
+    reference = None
+
+    for backend in BACKENDS:
+        try:
+            if backend != "eager":
+                export_backend(backend, load_model(), name, example_input)
+            model = create_backend(backend, load_model, name, example_input, source_path)
+        except Exception as e:
+            print(f"  {backend:>11}: unavailable ({e})")
+            continue
+
+        predicted_labels, accuracy = evaluate(model, batches, labels, vocab)
+        if reference is None:
+            reference = predicted_labels
+        agreement = sum(p == r for p, r in zip(predicted_labels, reference)) / max(len(reference), 1)
+
+        single = example_input[:1]
+        burst = example_input[:1].repeat(BURST_SIZE, 1, 1, 1)
+        results[backend] = {
+            'top1': accuracy,
+            'agreement_with_eager': agreement,
+            'batch_1_ms': median_latency_ms(model, single),
+            f'batch_{BURST_SIZE}_ms': median_latency_ms(model, burst)
+        }
+        print(f"  {backend:>11}: top-1 {accuracy:.3f}, agreement {agreement:.3f}, "
+              f"batch 1 {results[backend]['batch_1_ms']:.1f} ms, "
+              f"batch {BURST_SIZE} {results[backend][f'batch_{BURST_SIZE}_ms']:.1f} ms")
+    return results
+
+print("Backend benchmark started.")
+report = {'torch': torch.__version__, 'threads': torch.get_num_threads(), 'layers': {}}
+
+frames, labels = load_folder(first_layer_folder)
+batches = [torch.cat([frame_to_tensor(frame) for frame in frames[i:i + BURST_SIZE]]) for i in range(0, len(frames), BURST_SIZE)]
+report['layers']['first_layer'] = benchmark_layer(
+    "first_layer", lambda: load_pth_model(PTH_MODEL_PATH), torch.zeros(1, 3, 224, 224), PTH_MODEL_PATH,
+    batches, labels, load_imagenet_classes()
+)
+
+if garbage_folder:
+    learn = load_pkl_model(PKL_MODEL_PATH)
+    frames, labels = load_folder(garbage_folder)
+    batches = [garbage_batch(learn, frames[i:i + BURST_SIZE]) for i in range(0, len(frames), BURST_SIZE)]
+    report['layers']['garbage'] = benchmark_layer(
+        "garbage", lambda: learn.model, batches[0][:1], PKL_MODEL_PATH, batches, labels, list(learn.dls.vocab)
+    )
+
+with open(output_path, "w") as file:
+    json.dump(report, file, indent=2, sort_keys=True)
+
+print(f"\nResults written to {output_path}")
+print("Backend benchmark complete.")
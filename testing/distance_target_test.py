@@ -0,0 +1,57 @@
+# Import libraries
+import time
+import threading
+from gpiozero.pins.mock import MockFactory
+
+# Import modules
+from odometry import OdometryEngine
+
+## Test event-driven distance targets with simulated encoder ticks
+# Usage: python distance_target_test.py
+# Mock encoder pins tick at a steady wheel speed until the motors are "stopped". Compares how far
+# past the target the robot gets when the target fires from the ticks and when a loop polls every 100 ms.
+CM_PER_COUNT = 1.0
+TICK_INTERVAL = 0.005  # s between A edges, 2 counts each
+TARGET_CM = 60
+
+def simulate(use_target):
+    factory = MockFactory()
+    engine = OdometryEngine((5, None), (6, None), CM_PER_COUNT, pin_factory=factory)
+    pins = (factory.pin(5), factory.pin(6))
+    motors_on = threading.Event()
+
+    def stop_motors():
+        motors_on.clear()
+
+    def tick_stream():
+        while motors_on.is_set():
+            for pin in pins:
+                pin.drive_low() if pin.state else pin.drive_high()
+            time.sleep(TICK_INTERVAL)
+
+    start = time.perf_counter()
+    if use_target:
+        target = engine.add_distance_target(TARGET_CM, stop_motors)
+        motors_on.set()
+        stream = threading.Thread(target=tick_stream)
+        stream.start()
+        target.wait()
+    else:
+        motors_on.set()
+        stream = threading.Thread(target=tick_stream)
+        stream.start()
+        while engine.snapshot().distance < TARGET_CM:
+            time.sleep(0.1)
+        stop_motors()
+    stream.join()
+    elapsed = time.perf_counter() - start
+
+    overshoot = engine.snapshot().distance - TARGET_CM
+    engine.close()
+    return overshoot, elapsed
+
+print("Distance target test started.")
+for use_target, name in ((False, "100 ms poll"), (True, "tick target")):
+    overshoot, elapsed = simulate(use_target)
+    print(f"{name:>12}: overshoot {overshoot:.1f} cm ({overshoot / CM_PER_COUNT:.0f} counts) after {elapsed:.2f} s")
+print("Distance target test complete.")
@@ -1,6 +1,8 @@
 import time
 import gpio
 
+gpio.init_gpio()
+
 ## Test GPIO functions
 print("GPIO testing started")
 
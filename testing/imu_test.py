@@ -1,4 +1,11 @@
+import gpio
 import motion
+import navigation
+from arbiter import start_motion_arbiter, stop_motion_arbiter
+
+gpio.init_gpio()
+navigation.init_navigation()
+start_motion_arbiter()
 
 ## Test IMU functions
 print("IMU testing started.")
@@ -19,4 +26,5 @@ print("Turn IMU left 90 degrees.")
 motion.turn_left_until(90)
 print("Turned leftt 90 degrees...")
 
+stop_motion_arbiter()
 print("IMU testing complete.")
\ No newline at end of file
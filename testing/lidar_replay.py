@@ -0,0 +1,32 @@
+# Import libraries
+import sys
+import time
+
+# Import modules
+import perception
+from lidar_recording import replay_factory
+
+## Replay a raw LiDAR recording through the scanner and object tracker
+# Usage: python lidar_replay.py <recording> [--realtime]
+path = sys.argv[1]
+realtime = "--realtime" in sys.argv[2:]
+
+revolutions = 0
+def count_revolution(angles, distances, start_time, end_time):
+    global revolutions
+    revolutions += 1
+    for obj in perception.get_confirmed_objects(since=start_time):
+        print(f"Revolution {revolutions}:", end="")
+        perception.print_object(obj)
+
+print(f"Replaying {path} ({'real time' if realtime else 'unthrottled'})...")
+start = time.perf_counter()
+
+scanner = perception.LidarScanner(replay_factory(path, realtime))
+scanner.add_revolution_callback(perception.track_revolution)
+scanner.add_revolution_callback(count_revolution)
+scanner.start()
+scanner.thread.join()
+
+elapsed = time.perf_counter() - start
+print(f"Replayed {revolutions} revolutions in {elapsed:.2f} s ({revolutions / elapsed:.1f} revolutions/s).")
@@ -0,0 +1,80 @@
+# Import libraries
+import time
+import random
+
+# Import modules
+import perception
+
+## Test the LiDAR scanner service with a fake RPLidar
+# Usage: python lidar_scanner_test.py
+# The fake device sweeps whole revolutions of one measurement per degree, with the angle jittering
+# back and forth across 0/360 at every wrap. An object 500 mm straight ahead (270°) is the only thing
+# within detection range.
+REVOLUTIONS = 20
+REVOLUTION_TIME = 0.02  # s, faster than the real 5.5 Hz to keep the test short
+OBJECT_ANGLES = (265, 275)
+OBJECT_DISTANCE_MM = 500
+BACKGROUND_DISTANCE_MM = 3000
+
+class FakeRPLidar:
+    def __init__(self, revolutions=None):
+        self.revolutions = revolutions  # None keeps scanning until the scanner stops
+        self.calls = []
+
+    def start_motor(self):
+        self.calls.append("start_motor")
+
+    def iter_measures(self):
+        revolution = 0
+        while self.revolutions is None or revolution < self.revolutions:
+            for step in range(360):
+                angle = step + random.uniform(-0.4, 0.4)
+                if step < 3:
+                    # Jitter across the wrap: 359.x, 0.x, 359.x, ...
+                    angle = 359.5 + random.uniform(0, 0.4) if step % 2 else random.uniform(0, 0.4)
+                in_object = OBJECT_ANGLES[0] <= angle <= OBJECT_ANGLES[1]
+                distance = OBJECT_DISTANCE_MM if in_object else BACKGROUND_DISTANCE_MM
+                yield (step == 0, 15, angle % 360, distance)
+            revolution += 1
+            time.sleep(REVOLUTION_TIME)
+
+    def stop(self):
+        self.calls.append("stop")
+
+    def stop_motor(self):
+        self.calls.append("stop_motor")
+
+    def disconnect(self):
+        self.calls.append("disconnect")
+
+print("LiDAR scanner test started.")
+passed = True
+
+# Every wrap after the first closes one revolution, so a finite run of N revolutions yields N - 2
+# (the partial revolution before the first wrap and the unclosed last one are dropped)
+device = FakeRPLidar(REVOLUTIONS)
+scanner = perception.LidarScanner(lambda: device)
+scanner.start()
+scanner.thread.join(5)
+print(f"Revolutions counted: {scanner.revolution_count} of {REVOLUTIONS - 2} expected")
+print(f"Device calls on exhaustion: {device.calls}")
+passed &= scanner.revolution_count == REVOLUTIONS - 2
+passed &= device.calls == ["start_motor", "stop", "stop_motor", "disconnect"]
+
+# Clean shutdown of an endless device, and detection from revolutions after a given time
+device = FakeRPLidar()
+perception.start_lidar_scanner(lambda: device)
+since = time.monotonic()
+start = time.perf_counter()
+obj = perception.detect_object_of_interest(since=since)
+elapsed = time.perf_counter() - start
+print(f"Detection took {elapsed * 1000:.0f} ms")
+passed &= obj is not None and abs(obj['distance_mm'] - OBJECT_DISTANCE_MM) < 20 and abs(obj['relative_angle_deg']) < 2
+passed &= obj is not None and obj['last_seen'] >= since
+
+scanner = perception.lidar_scanner
+perception.stop_lidar_scanner()
+print(f"Scanner running after stop: {scanner.is_running()}, device calls: {device.calls}")
+passed &= not scanner.is_running() and device.calls == ["start_motor", "stop", "stop_motor", "disconnect"]
+
+print("LiDAR scanner test passed." if passed else "LiDAR scanner test failed.")
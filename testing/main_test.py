@@ -29,7 +29,7 @@ def loop(PERIMETER_X, PERIMETER_Y, facing_up):
 
     while True:
         print("Moving forward 4.5 cm on Y axis...")
-        move_forward_until(4.5, "path", "y")
+        move_forward_until(4.5)
 
         print("Running LiDAR scan...")
         object = detect_object_of_interest()
@@ -58,7 +58,7 @@ def loop(PERIMETER_X, PERIMETER_Y, facing_up):
                 print("Turning right 90 degrees..")
                 turn_right_until(90)
                 print("Turned right 90 degrees, moving forward...")
-                move_forward_until(side_distance * 1.5, "path", "x")
+                move_forward_until(side_distance * 1.5)
                 print("Moved forward, turning right 90 degrees..")
                 turn_right_until(90)
                 print("Turned right 90 degrees.")
@@ -66,7 +66,7 @@ def loop(PERIMETER_X, PERIMETER_Y, facing_up):
                 print("Turning left 90 degrees..")
                 turn_left_until(90)
                 print("Turned left 90 degrees, moving forward...")
-                move_forward_until(side_distance * 1.5, "path", "x")
+                move_forward_until(side_distance * 1.5)
                 print("Moved forward, turning left 90 degrees...")
                 turn_left_until(90)
                 print("Turned left 90 degrees.")
@@ -79,12 +79,12 @@ def loop(PERIMETER_X, PERIMETER_Y, facing_up):
         if distance_travelled_x >= 0.9 * PERIMETER_X:
             print("Reached end of X path. Resetting path...")
             print("Moving backward until path distance is reset...")
-            move_backward_until(update_path_distance("x"), "path", "x")
+            move_backward_until(update_path_distance("x"))
             if facing_up:
                 print("Turning left 90 degrees...")
                 turn_left_until(90)
                 print("Turned left 90 degrees, moving backward...")
-                move_backward_until(update_path_distance("y"), "path", "y")
+                move_backward_until(update_path_distance("y"))
             else:
                 print("Turning left 90 degrees...")
                 turn_left_until(90)
@@ -127,7 +127,7 @@ def object_event_off_path(object_distance, object_angle):
 
 def object_event_on_path(object_distance, object_width):
     print("Approaching object on path...")
-    move_forward_until(object_distance - collection_distance, "path", "y")
+    move_forward_until(object_distance - collection_distance)
     if not is_tall_object_present(object_distance * 10) and run_ml_pipeline():
         print("Garbage detected. Collecting...")
         collect_garbage()
@@ -139,15 +139,15 @@ def obstacle_event(object_width):
     print("Avoiding obstacle on path, turning right 90 degrees...")
     turn_right_until(90)
     print("Turned right 90 degrees, moving forward until 3 times the object width...")
-    move_forward_until(3 * object_width, "path", "x")
+    move_forward_until(3 * object_width)
     print("Moved forward, turning left 90 degrees...")
     turn_left_until(90)
     print("Turned left 90 degrees, moving forward until 3 times the object width...")
-    move_forward_until(3 * object_width, "path", "y")
+    move_forward_until(3 * object_width)
     print("Moved forward, turning left 90 degrees...")
     turn_left_until(90)
     print("Turned left 90 degrees, moving forward until 3 times the object width...")
-    move_forward_until(3 * object_width, "path", "x")
+    move_forward_until(3 * object_width)
     print("Moved forward, turning right 90 degrees...")
     turn_right_until(90)
     print("Turned right 90 degrees, obstacle avoided. Back on path.")
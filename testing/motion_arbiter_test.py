@@ -0,0 +1,108 @@
+# Import libraries
+import time
+import threading
+from gpiozero.pins.mock import MockFactory
+
+# Import modules
+import gpio
+import motion
+import navigation
+from imu import Bno055Emulator
+from arbiter import start_motion_arbiter, stop_motion_arbiter, get_motion_stats
+from motion import move_forward_until, correct_deviation
+
+## Test the motion arbiter with simulated wheels and IMU
+# Usage: python motion_arbiter_test.py
+# A robot model reads the motor pins: moving and turning tick the mock encoder pins, turning also spins
+# the emulated BNO055. A deviation correction submitted halfway through a straight move pre-empts it, and the move
+# then finishes the distance it had left. A move whose encoders stop ticking must time out and stop.
+TICK_INTERVAL = 0.005  # s between A edges
+TURN_RATE = 90.0       # degrees/s
+BRAKING_LAG = 0.1      # s the robot keeps turning after the motors stop
+MOVE_CM = 60
+DEVIATION_DEG = 20
+STALLED_MOVE_CM = 10
+
+factory = MockFactory()
+emulator = Bno055Emulator()
+gpio.init_gpio(factory)
+navigation.init_encoders(factory)
+navigation.init_imu(i2c_bus=emulator)
+navigation.init_pose()
+encoder_pins = (factory.pin(navigation.left_A), factory.pin(navigation.right_A))
+running = True
+stalled = False  # Encoders unplugged: the wheels turn but nothing ticks
+
+def robot_model():
+    last_turning = 0.0
+    while running:
+        command = (gpio.pin23.value, gpio.pin24.value, gpio.pin25.value)
+        if not stalled and command in ((0, 1, 0), (0, 1, 1), (1, 0, 0), (1, 0, 1)):  # The wheels spin when turning too
+            for pin in encoder_pins:
+                pin.drive_low() if pin.state else pin.drive_high()
+        rate = {(1, 0, 1): TURN_RATE, (1, 0, 0): -TURN_RATE}.get(command)
+        if rate is not None:
+            emulator.gyro_z = rate
+            last_turning = time.monotonic()
+        elif time.monotonic() - last_turning > BRAKING_LAG:
+            emulator.gyro_z = 0.0
+        time.sleep(TICK_INTERVAL)
+
+def correction():
+    time.sleep(0.15)  # Part way through the move
+    start = time.monotonic()
+    correct_deviation(DEVIATION_DEG)
+    print(f"Correction done after {time.monotonic() - start:.2f} s")
+
+print("Motion arbiter test started.")
+start_motion_arbiter()
+model = threading.Thread(target=robot_model)
+model.start()
+time.sleep(0.2)
+start_distance = navigation.read_odometry().distance
+start_heading = navigation.read_imu().heading
+
+corrector = threading.Thread(target=correction)
+corrector.start()
+move_forward_until(MOVE_CM)
+corrector.join()
+
+distance = navigation.read_odometry().distance - start_distance
+heading = navigation.read_imu().heading - start_heading
+# The robot was on its path before the correction, so the correction itself is now the deviation:
+# a correction turn must leave the path direction where it was
+deviation = navigation.update_deviation_angle()
+
+stalled = True
+motion.MOVE_START_TIME = 0.2  # Keep the timeout short
+start = time.monotonic()
+try:
+    move_forward_until(STALLED_MOVE_CM)
+    stalled_move = "completed"
+except RuntimeError:
+    stalled_move = "timed out"
+stalled_time = time.monotonic() - start
+motors_stopped = (gpio.pin23.value, gpio.pin24.value, gpio.pin25.value) == (0, 0, 0)
+stats = get_motion_stats()
+running = False
+model.join()
+stop_motion_arbiter()
+navigation.stop_imu()
+
+# Nothing may drive the motors once the arbiter is stopped
+try:
+    correct_deviation(DEVIATION_DEG)
+    submit_after_stop = "accepted"
+except RuntimeError:
+    submit_after_stop = "refused"
+
+print(f"Moved {distance:.1f} cm of {MOVE_CM} cm, turned {heading:.1f} degrees of {-DEVIATION_DEG}")
+print(f"Deviation after the correction: {deviation:.1f} degrees, command after stop {submit_after_stop}")
+print(f"Stalled move {stalled_move} after {stalled_time:.2f} s, motors stopped {motors_stopped}")
+print(f"Arbiter stats: {stats}")
+if (stats['preemptions'] == 1 and abs(distance - MOVE_CM) < 5 and abs(heading + DEVIATION_DEG) < 5
+        and abs(deviation - heading) < 1 and submit_after_stop == "refused"
+        and stalled_move == "timed out" and motors_stopped and stats['failed'] == 1):
+    print("Motion arbiter test passed.")
+else:
+    print("Motion arbiter test failed.")
@@ -0,0 +1,135 @@
+# Import libraries
+import sys
+import json
+import math
+import time
+import tracemalloc
+import numpy as np
+
+# Import modules
+import perception
+from perception import (find_objects_in_revolution, find_objects_in_arrays, polar_to_cartesian, filter_fov,
+                        to_cartesian, segment_gaps, merge_clusters, analyze_clusters, ObjectTracker)
+
+## Perception benchmark suite with synthetic scans
+# Usage: python perception_benchmark.py [results.json]
+# Writes per-stage latency and memory for every scenario to a JSON file that can be diffed between
+# commits.
+output_path = sys.argv[1] if len(sys.argv) > 1 else "perception_benchmark.json"
+
+def synthetic_scan(points_per_revolution=360, objects=(), walls=(), noise_mm=10, dropout=0.05, seed=0):
+    # One revolution as angle/distance arrays.
+    # objects: (center angle deg, distance mm, width mm), walls: (start deg, end deg, distance mm) for a
+    # straight wall facing the robot. The closest surface along each beam wins; 0 means no return.
+    rng = np.random.default_rng(seed)
+    angles = (np.arange(points_per_revolution) + rng.random(points_per_revolution) * 0.5) * 360 / points_per_revolution
+    distances = np.full(points_per_revolution, np.inf)
+
+    for start, end, wall_distance in walls:
+        on_wall = (angles >= start) & (angles <= end)
+        wall_ranges = wall_distance / np.abs(np.cos(np.radians(angles - 270)))
+        distances = np.where(on_wall, np.minimum(distances, wall_ranges), distances)
+
+    for center, object_distance, width in objects:
+        half_span = math.degrees(math.atan(width / 2 / object_distance))
+        on_object = np.abs(angles - center) <= half_span
+        distances = np.where(on_object, np.minimum(distances, object_distance), distances)
+
+    distances = distances + rng.normal(0, noise_mm, points_per_revolution)
+    distances[~np.isfinite(distances) | (rng.random(points_per_revolution) < dropout)] = 0
+    return angles, np.maximum(distances, 0)
+
+def cluttered_objects(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return tuple(zip(rng.uniform(230, 310, count), rng.uniform(300, 1900, count), rng.uniform(20, 120, count)))
+
+SCENARIOS = {
+    "sparse": {'objects': ((250, 600, 80), (270, 900, 200), (290, 1400, 40)), 'walls': ((225, 315, 1900),)},
+    "cluttered": {'objects': cluttered_objects(40), 'walls': ()},
+    "walls_only": {'objects': (), 'walls': ((225, 260, 800), (260, 315, 1500))}
+}
+DENSITIES = (360, 2000, 10000)
+
+def measure(function, repeats):
+    # Median latency over repeats, then peak traced memory and net allocated blocks of one more call
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    function()
+    blocks_after = sys.getallocatedblocks()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'median_ms': round(float(np.median(times)) * 1000, 4),
+        'min_ms': round(min(times) * 1000, 4),
+        'peak_kib': round(peak / 1024, 1),
+        'net_blocks': blocks_after - blocks_before
+    }
+
+def benchmark_scenario(angles, distances, repeats):
+    params = perception.DETECTION_PARAMS
+    scan_points = list(zip(angles.tolist(), distances.tolist()))
+
+    fov_angles, fov_distances = filter_fov(angles, distances, params['max_distance'])
+    x, y = to_cartesian(fov_angles, fov_distances)
+    starts, ends = segment_gaps(x, y, params['max_gap_mm'], params['min_points'])
+    labels = merge_clusters(x, y, starts, ends, params['merge_cluster_threshold_mm'])
+    objects = analyze_clusters(fov_angles, fov_distances, starts, ends, labels,
+                               params['min_physical_width_mm'], params['big_object_threshold_mm'])
+
+    expected = find_objects_in_revolution(scan_points, **params)
+    if objects != expected:
+        print(f"  Mismatch between pipelines:\n    python: {expected}\n    numpy:  {objects}")
+
+    tracker = ObjectTracker()
+    clock = [0.0]
+    def track():
+        clock[0] += 0.1
+        tracker.update(objects, clock[0], clock[0])
+
+    stages = {
+        'python_polar_to_cartesian': lambda: [polar_to_cartesian(a, d) for a, d in scan_points],
+        'python_pipeline': lambda: find_objects_in_revolution(scan_points, **params),
+        'filter_fov': lambda: filter_fov(angles, distances, params['max_distance']),
+        'to_cartesian': lambda: to_cartesian(fov_angles, fov_distances),
+        'segment_gaps': lambda: segment_gaps(x, y, params['max_gap_mm'], params['min_points']),
+        'merge_clusters': lambda: merge_clusters(x, y, starts, ends, params['merge_cluster_threshold_mm']),
+        'analyze_clusters': lambda: analyze_clusters(fov_angles, fov_distances, starts, ends, labels,
+                                                     params['min_physical_width_mm'], params['big_object_threshold_mm']),
+        'tracker_update': track,
+        'numpy_pipeline': lambda: find_objects_in_arrays(angles, distances, **params)
+    }
+
+    results = {name: measure(stage, repeats) for name, stage in stages.items()}
+    results['points_in_fov'] = len(fov_angles)
+    results['segments'] = len(starts)
+    results['objects'] = len(objects)
+    return results
+
+print("Perception benchmark started.")
+report = {'python': sys.version.split()[0], 'numpy': np.__version__, 'scenarios': {}}
+
+for scenario, params in SCENARIOS.items():
+    for points_per_revolution in DENSITIES:
+        name = f"{scenario}_{points_per_revolution}"
+        angles, distances = synthetic_scan(points_per_revolution, **params)
+        repeats = max(5, 20000 // points_per_revolution)
+        results = benchmark_scenario(angles, distances, repeats)
+        report['scenarios'][name] = results
+
+        python_ms = results['python_pipeline']['median_ms']
+        numpy_ms = results['numpy_pipeline']['median_ms']
+        print(f"{name:>20}: python {python_ms:.2f} ms, numpy {numpy_ms:.2f} ms, "
+              f"speedup {python_ms / numpy_ms:.1f}x ({results['objects']} objects)")
+
+with open(output_path, "w") as file:
+    json.dump(report, file, indent=2, sort_keys=True)
+
+print(f"Results written to {output_path}")
+print("Perception benchmark complete.")
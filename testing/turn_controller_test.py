@@ -0,0 +1,53 @@
+# Import libraries
+import time
+import threading
+
+# Import modules
+from imu import BNO055, Bno055Emulator, ImuSampler
+from motion import TurnController
+
+## Test predictive turn stops against the BNO055 emulator
+# Usage: python turn_controller_test.py
+# The emulated robot turns at a steady rate and keeps rotating for BRAKING_LAG after the stop.
+# A controller that starts with no lag overshoots on the first turns, then learns the lag.
+RATE_HZ = 100
+TURN_RATE = 90.0   # degrees/s
+BRAKING_LAG = 0.2  # s of full rate rotation after stop_turning
+TURN_DEG = 90
+TURNS = 6
+
+emulator = Bno055Emulator()
+device = BNO055(emulator)
+device.begin()
+sampler = ImuSampler(device.read_sample, RATE_HZ)
+sampler.start()
+time.sleep(0.2)
+
+def start_right():
+    emulator.gyro_z = TURN_RATE
+
+def start_left():
+    emulator.gyro_z = -TURN_RATE
+
+def stop_turning():
+    # Brake after the lag, without blocking the sampler thread
+    def brake():
+        time.sleep(BRAKING_LAG)
+        emulator.gyro_z = 0.0
+    threading.Thread(target=brake).start()
+
+print("Turn controller test started.")
+controller = TurnController(sampler.snapshot, stop_lag=0.0)
+sampler.add_sample_callback(controller.on_sample)
+for turn in range(TURNS):
+    direction = 1 if turn % 2 == 0 else -1
+    start_motors = start_right if direction == 1 else start_left
+    angle = controller.turn(TURN_DEG, direction, start_motors, stop_turning)
+    print(f"Turn {turn + 1}: {angle:7.1f} degrees, error {controller.last_error:5.1f} degrees, "
+          f"learned lag {controller.stop_lag * 1000:.0f} ms")
+sampler.stop()
+
+if abs(controller.last_error) < 5:
+    print("Turn controller test passed.")
+else:
+    print("Turn controller test failed.")